@@ -1,8 +1,15 @@
 from fastapi import FastAPI, Query
+from fastapi.responses import PlainTextResponse
 import sqlite3
 import os
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
-import torch
+import logging
+from observability import configure_logging, render_metrics, timed
+from db import get_connection, parameterize_sql, install as install_snapshot_refresh
+from sql_guard import execute_guarded
+from traffic_capture import annotate, install as install_traffic_capture
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -11,15 +18,26 @@ DB_PATH = os.getenv('SQLITE_DB_PATH', 'local_data.db')
 TABLE_NAME = "facts_assessment"
 MODEL_NAME = "mrm8488/t5-base-finetuned-wikiSQL"  # Publicly available text-to-SQL model
 CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+# "hybrid" serves from the model, "rules" from the rule-based generator only
+NL2SQL_MODE = os.getenv('NL2SQL_MODE', 'hybrid')
 
-# Ensure cache directory exists
-os.makedirs(CACHE_DIR, exist_ok=True)
+# Model and tokenizer, loaded on first use (see get_model)
+model, tokenizer = None, None
 
-# Load model and tokenizer
-print(f"Loading {MODEL_NAME} model...")
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, cache_dir=CACHE_DIR)
-model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME, cache_dir=CACHE_DIR)
-print("Model loaded successfully!")
+def get_model():
+    """Load model and tokenizer once; torch/transformers are only imported here"""
+    global model, tokenizer
+    if model is None or tokenizer is None:
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        
+        # Ensure cache directory exists
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        
+        logger.info("Loading %s model...", MODEL_NAME)
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, cache_dir=CACHE_DIR)
+        model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME, cache_dir=CACHE_DIR)
+        logger.info("Model loaded successfully!")
+    return model, tokenizer
 
 # Initialize database
 def init_db():
@@ -38,8 +56,7 @@ def init_db():
 # Get database schema
 def get_schema():
     """Read SQLite schema for groundwater database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cursor = get_connection().cursor()
     
     # Get column information
     cursor.execute(f"PRAGMA table_info({TABLE_NAME});")
@@ -55,8 +72,6 @@ def get_schema():
     
     cursor.execute(f"SELECT DISTINCT DISTRICT FROM {TABLE_NAME} LIMIT 5;")
     districts = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
 
     # Format schema information
     columns = [col[1] for col in schema_info]  # column names
@@ -71,28 +86,42 @@ def get_schema():
 # Generate SQL from natural language
 def generate_sql(question, max_length=128):
     """Generate SQL from natural language using the Spider T5 model"""
+    if NL2SQL_MODE == "rules":
+        from text2sql_local_rules import generate_sql as rules_generate_sql
+        return rules_generate_sql(question)
+    
+    import torch
+    model, tokenizer = get_model()
     schema = get_schema()
     
     # Create schema-aware prompt
     prompt = f"translate English to SQL given the schema:\n{schema}\nQuestion: {question}\nSQL:"
     
     # Generate SQL
-    inputs = tokenizer(prompt, return_tensors="pt", max_length=512, truncation=True)
+    with timed("tokenize"):
+        inputs = tokenizer(prompt, return_tensors="pt", max_length=512, truncation=True)
     with torch.no_grad():
-        outputs = model.generate(
-            **inputs, 
-            max_length=max_length, 
-            num_beams=5,
-            early_stopping=True
-        )
+        with timed("encode"):
+            encoder_outputs = model.get_encoder()(**inputs)
+        with timed("generate"):
+            outputs = model.generate(
+                encoder_outputs=encoder_outputs,
+                attention_mask=inputs["attention_mask"],
+                max_length=max_length, 
+                num_beams=5,
+                early_stopping=True
+            )
     
     # Decode and clean
-    sql = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
-    return ensure_complete_sql(sql)
+    with timed("decode"):
+        sql = tokenizer.decode(outputs[0], skip_special_tokens=True).strip()
+    return ensure_complete_sql(sql, question)
 
 # Make sure SQL is complete and valid
-def ensure_complete_sql(sql):
-    """Fixes common issues in generated SQL"""
+def ensure_complete_sql(sql, question=""):
+    """Fixes common issues in generated SQL and prunes SELECT * to the question's columns"""
+    from text2sql_local_rules import prune_projection
+    
     sql = sql.strip()
     
     # Basic fixes
@@ -111,21 +140,21 @@ def ensure_complete_sql(sql):
     if not sql.endswith(";"):
         sql += ";"
         
-    return sql
+    return prune_projection(sql, question)
 
 # Execute SQL safely
-def execute_sql(sql):
-    """Execute SQL and return results"""
+def execute_sql(sql, params=()):
+    """Execute SQL (optionally a template with bound params) and return results"""
     if not sql.lower().startswith("select"):
         return {"success": False, "error": "Only SELECT queries allowed"}
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.execute(sql)
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        results = [dict(zip(columns, row)) for row in rows]
-        conn.close()
+        with timed("execute"):
+            # Shared per-thread connection, so prepared statements are reused
+            cursor = get_connection().execute(sql, params)
+            columns = [desc[0] for desc in cursor.description]
+            rows = cursor.fetchall()
+            results = [dict(zip(columns, row)) for row in rows]
         return {"success": True, "data": results, "columns": columns}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -133,6 +162,18 @@ def execute_sql(sql):
 # Initialize database on startup
 init_db()
 
+@app.on_event("startup")
+def preload_model():
+    # Load the model before the first request unless serving rules only
+    if NL2SQL_MODE != "rules":
+        get_model()
+
+# Opt-in request capture for replay (TRAFFIC_CAPTURE_PATH)
+install_traffic_capture(app)
+
+# Switch to newly published data snapshots between requests
+install_snapshot_refresh(app)
+
 # API endpoints
 @app.get("/")
 def root():
@@ -142,32 +183,45 @@ def root():
 def nl2sql(question: str):
     """Convert natural language to SQL and execute"""
     try:
-        # Generate SQL
-        sql = generate_sql(question)
+        # Generate SQL, binding location literals as parameters
+        sql, params = parameterize_sql(generate_sql(question))
         
         # Execute SQL
-        result = execute_sql(sql)
+        result = execute_sql(sql, params)
+        annotate(path=NL2SQL_MODE, rows=len(result.get("data", [])), error=not result["success"])
         
         if result["success"]:
             return {
                 "sql": sql,
+                "params": params,
                 "data": result["data"],
                 "columns": result["columns"]
             }
         else:
-            return {"error": result["error"], "sql": sql}
+            return {"error": result["error"], "sql": sql, "params": params}
     except Exception as e:
+        annotate(path=NL2SQL_MODE, error=True)
         return {"error": f"Unexpected error: {str(e)}"}
 
 @app.get("/query")
 def query(sql: str = Query(..., description="SQL query (SELECT only)")):
     """Execute raw SQL query"""
-    result = execute_sql(sql)
+    if not sql.strip().lower().startswith("select"):
+        annotate(error=True)
+        return {"error": "Only SELECT queries allowed"}
+    # Raw SQL runs under the plan check and the time, VM-step and row budgets
+    result = execute_guarded(sql)
+    annotate(rows=len(result.get("data", [])), truncated=result.get("truncated", False), error=not result["success"])
     if result["success"]:
-        return {"data": result["data"]}
+        return {"data": result["data"], "truncated": result["truncated"], "row_limit": result["row_limit"]}
     else:
         return {"error": result["error"]}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus-style metrics for the NL -> SQL pipeline"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1,60 +1,162 @@
+import json
+import os
+import threading
+import time
+import urllib.parse
 import streamlit as st
 import requests
 import pandas as pd
+from requests.adapters import HTTPAdapter
 
 BACKEND_URL = "http://localhost:8000"
+# Address of the backend as seen from the user's browser (download links)
+PUBLIC_BACKEND_URL = os.getenv("PUBLIC_BACKEND_URL", BACKEND_URL)
+# (connect, read) timeouts in seconds for backend calls
+BACKEND_TIMEOUT = (float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3")), float(os.getenv("BACKEND_READ_TIMEOUT", "60")))
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "10"))
+# Seconds a result is reused for the same question before asking the backend again
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "300"))
 
-st.title("Groundwater Data NL → SQL Chat")
-st.subheader("Using hybrid PICARD+T5-small and rule-based NL → SQL conversion")
+def export_url(sql, params, file_format):
+    """Link to the backend's streamed export of the full result"""
+    query = urllib.parse.urlencode({
+        "sql": sql,
+        "params": json.dumps(params),
+        "format": file_format,
+        "full": "true",
+    })
+    return f"{PUBLIC_BACKEND_URL}/export?{query}"
 
-question = st.text_input("Ask a question about groundwater data:")
-debug_mode = st.checkbox("Show debugging info (model vs rule-based)")
+@st.cache_resource
+def get_session():
+    """One pooled keep-alive HTTP session shared by every rerun and browser session"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=BACKEND_POOL_SIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
 
-if st.button("Submit") and question:
-    with st.spinner("Generating SQL and fetching results..."):
-        try:
-            # Initialize resp variable before using it
-            resp = None
-            # Make the API request
-            resp = requests.post(f"{BACKEND_URL}/nl2sql", params={
-                "question": question,
-                "debug": debug_mode
-            })
-            result = resp.json()
-        except Exception as e:
-            # Safe access to resp.text if resp is defined
-            raw_response = getattr(resp, 'text', 'No response') if resp else 'No response'
-            st.error(f"Error connecting to backend: {e}\nRaw response: {raw_response}")
-            result = {}
-        
-        # Extract results
-        sql = result.get("sql", "")
-        data = result.get("data", [])
-        error = result.get("error", None)
-        raw_output = result.get("raw_output", "")
-        
+class TTLCache:
+    """Thread-safe map whose entries expire ttl seconds after they were stored"""
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() > entry[0]:
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            now = time.monotonic()
+            # Drop expired entries so the cache does not grow without bound
+            for expired in [k for k, (expires, _) in self._entries.items() if now > expires]:
+                del self._entries[expired]
+            self._entries[key] = (now + self.ttl, value)
+
+@st.cache_resource
+def get_result_cache():
+    """Results shared across reruns and browser sessions, keyed by (question, debug)"""
+    return TTLCache(RESULT_CACHE_TTL)
+
+def fetch_result(question, debug, on_progress):
+    """
+    Ask the backend's streaming endpoint and call on_progress(result) as the
+    SQL and each chunk of rows arrive
+
+    Returns:
+        result dict with "sql", "params", "columns", "rows", "raw_output",
+        "error" on failure, and "complete" once the backend sent its final
+        "done" line (never for failed requests, so they are not cached)
+    """
+    result = {"sql": "", "params": [], "columns": [], "rows": [], "raw_output": ""}
+    try:
+        resp = get_session().post(f"{BACKEND_URL}/nl2sql/stream", params={
+            "question": question,
+            "debug": debug
+        }, stream=True, timeout=BACKEND_TIMEOUT)
+        with resp:
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                message = json.loads(line)
+                kind = message.pop("type")
+                if kind == "rows":
+                    result["columns"] = message["columns"]
+                    result["rows"].extend(message["rows"])
+                elif kind == "done":
+                    result["complete"] = True
+                else:
+                    # "query" carries the SQL; "error" ends the stream
+                    result.update(message)
+                on_progress(result)
+    except Exception as e:
+        result["error"] = f"Error connecting to backend: {e}"
+    return result
+
+def render_result(result, slot, done):
+    """Draw a (possibly partial) result into slot, replacing what was there"""
+    sql = result.get("sql", "")
+    params = result.get("params", [])
+    rows = result.get("rows", [])
+    error = result.get("error", None)
+    raw_output = result.get("raw_output", "")
+
+    with slot.container():
         # Display SQL query
         st.markdown("### Generated SQL Query:")
         st.code(sql, language="sql")
-        
+        if params:
+            st.caption(f"Parameters: {params}")
+
         # Display results or errors
         if error:
             st.error(f"Error: {error}")
-        elif data:
+        elif rows:
             st.markdown("### Query Results:")
-            df = pd.DataFrame(data)
+            df = pd.DataFrame(rows, columns=result["columns"])
             st.dataframe(df, use_container_width=True)
-            
-            # Add download buttons
-            st.download_button(
-                label="Download as CSV",
-                data=df.to_csv(index=False).encode('utf-8'),
-                file_name='query_results.csv',
-                mime='text/csv',
-            )
-        else:
+
+            if done:
+                # The backend streams the full result (without the LIMIT) straight to the browser
+                st.link_button("Download all rows as CSV", export_url(sql, params, "csv"))
+                st.link_button("Download all rows as Parquet", export_url(sql, params, "parquet"))
+        elif done:
             st.info("No results returned.")
-            
+
         # Model output (for debugging)
         with st.expander("Model Debug Output"):
             st.markdown(f"**Raw Model Output:**\n```\n{raw_output}\n```")
+
+st.title("Groundwater Data NL → SQL Chat")
+st.subheader("Using hybrid PICARD+T5-small and rule-based NL → SQL conversion")
+
+question = st.text_input("Ask a question about groundwater data:")
+debug_mode = st.checkbox("Show debugging info (model vs rule-based)")
+
+# Remember the last submitted question so reruns from other widgets keep showing it
+if st.button("Submit") and question:
+    st.session_state["submitted"] = (question, debug_mode)
+
+if "submitted" in st.session_state:
+    submitted_question, submitted_debug = st.session_state["submitted"]
+    key = (" ".join(submitted_question.split()), submitted_debug)
+    cache = get_result_cache()
+    slot = st.empty()
+
+    result = cache.get(key)
+    if result is None:
+        with st.spinner("Generating SQL and fetching results..."):
+            result = fetch_result(submitted_question, submitted_debug,
+                                  lambda partial: render_result(partial, slot, done=False))
+        # Only successful answers are shared; a failure is retried on the next rerun
+        if result.get("complete") and not result.get("error"):
+            cache.put(key, result)
+    render_result(result, slot, done=True)
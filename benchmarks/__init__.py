@@ -0,0 +1,4 @@
+"""
+Latency and throughput benchmarks for the NL -> SQL pipeline.
+Run with: python -m benchmarks.run --help
+"""
@@ -0,0 +1,85 @@
+"""
+Synthetic facts_assessment database for benchmarks.
+Columns come from facts_assessment_schema.sql; values are drawn from a
+seeded RNG so the same arguments always produce the same database.
+"""
+
+import os
+import random
+import re
+import sqlite3
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMA_PATH = os.path.join(ROOT_DIR, 'facts_assessment_schema.sql')
+TABLE_NAME = "facts_assessment"
+
+# Named locations come first so the rule generator's DISTINCT ... LIMIT 20
+# lookups see the places the question corpus asks about
+LOCATIONS = {
+    "TAMIL NADU": ["CHENNAI", "COIMBATORE", "MADURAI", "SALEM"],
+    "KARNATAKA": ["MYSORE", "BANGALORE URBAN", "BELGAUM"],
+    "MAHARASHTRA": ["PUNE", "NAGPUR", "NASHIK"],
+    "KERALA": ["ERNAKULAM", "THRISSUR"],
+    "GUJARAT": ["AHMEDABAD", "SURAT"],
+    "RAJASTHAN": ["JAIPUR", "JODHPUR"],
+}
+
+_COLUMN_PATTERN = re.compile(r'^\s*"([^"]+)"\s+(\w+)', re.MULTILINE)
+
+def read_schema_columns(schema_path=SCHEMA_PATH):
+    """Return [(column name, declared type)] from the schema file"""
+    with open(schema_path, 'r') as f:
+        return _COLUMN_PATTERN.findall(f.read())
+
+def _location_rows(rows):
+    """Yield (state, district) pairs: the named locations, then synthetic ones"""
+    named = [(state, district) for state, districts in LOCATIONS.items() for district in districts]
+    states = list(LOCATIONS)
+    for i in range(rows):
+        if i < len(named):
+            yield named[i]
+        else:
+            yield states[i % len(states)], f"SYNTHETIC DISTRICT {i:05d}"
+
+def build_fixture_db(db_path, rows=500, seed=42, schema_path=SCHEMA_PATH):
+    """Create (or replace) a synthetic database at db_path and return its path"""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rng = random.Random(seed)
+    columns = read_schema_columns(schema_path)
+
+    conn = sqlite3.connect(db_path)
+    with open(schema_path, 'r') as f:
+        conn.executescript(f.read())
+
+    placeholders = ", ".join("?" for _ in columns)
+    records = []
+    for i, (state, district) in enumerate(_location_rows(rows)):
+        record = []
+        for name, col_type in columns:
+            if name.startswith("S.No"):
+                record.append(str(i + 1))
+            elif name.startswith("STATE"):
+                record.append(state)
+            elif name.startswith("DISTRICT"):
+                record.append(district)
+            elif col_type.upper() == "FLOAT":
+                record.append(round(rng.uniform(0, 100000), 2))
+            else:
+                record.append(f"value {rng.randint(0, 9)}")
+        records.append(record)
+    conn.executemany(f"INSERT INTO {TABLE_NAME} VALUES ({placeholders})", records)
+    conn.commit()
+    conn.close()
+    return db_path
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a synthetic facts_assessment database")
+    parser.add_argument("db_path")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    build_fixture_db(args.db_path, rows=args.rows, seed=args.seed)
+    print(f"Wrote {args.rows} rows to {args.db_path}")
@@ -0,0 +1,185 @@
+"""
+Replay captured /nl2sql and /query traffic against a server for capacity planning.
+
+Reads the JSONL records written by traffic_capture.py (record TRAFFIC_CAPTURE_PATH
+on a production server first) and re-sends them on the original schedule,
+scaled by --speed, with at most --concurrency requests in flight. Reports
+latency percentiles, throughput and error rates overall and per endpoint.
+Latency is measured from each request's scheduled send time, so queueing
+behind --concurrency shows up as it would for real users.
+
+Without --base-url a local main:app is started against a synthetic database
+with the stub model, so replays run offline.
+
+Examples:
+    python -m benchmarks.replay traffic.jsonl
+    python -m benchmarks.replay traffic.jsonl --speed 4 --concurrency 32
+    python -m benchmarks.replay traffic.jsonl --base-url http://localhost:8000 --model local
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.fixture import build_fixture_db
+from benchmarks.run import _http_call, git_commit, start_server
+from benchmarks.stats import percentile, summarize
+
+def load_records(paths):
+    """
+    Read capture records, oldest first
+
+    A path may name a rotated log; its backups (<path>.N, higher N is older)
+    are read before it.
+    """
+    files = []
+    for path in paths:
+        backups = [name for name in glob.glob(glob.escape(path) + ".*") if name.rsplit(".", 1)[1].isdigit()]
+        files.extend(sorted(backups, key=lambda name: int(name.rsplit(".", 1)[1]), reverse=True))
+        files.append(path)
+
+    records = []
+    for name in files:
+        with open(name, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+def build_request(record, base_url):
+    """(method, url) that re-sends one captured request"""
+    if record["endpoint"] == "/nl2sql":
+        return "POST", f"{base_url}/nl2sql?" + urllib.parse.urlencode({"question": record["question"]})
+    return "GET", f"{base_url}/query?" + urllib.parse.urlencode({"sql": record["sql"]})
+
+def replay(records, base_url, speed=1.0, concurrency=8):
+    """
+    Send records on their original schedule divided by speed (speed 0 sends
+    them back to back)
+
+    Returns:
+        {"overall": summarize(...), "endpoints": {endpoint: summarize(...)},
+        "schedule_lag_ms": p95/max of how late requests were sent}
+    """
+    if not records:
+        raise ValueError("No records to replay")
+    first = records[0]["ts"]
+    results = []
+    lags = []
+    lock = threading.Lock()
+
+    def send(record, scheduled):
+        lag = max(0.0, time.perf_counter() - scheduled)
+        try:
+            ok = _http_call(*build_request(record, base_url))
+        except Exception:
+            ok = False
+        elapsed = (time.perf_counter() - scheduled) * 1000
+        with lock:
+            results.append((record["endpoint"], elapsed, ok))
+            lags.append(lag * 1000)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for record in records:
+            offset = (record["ts"] - first) / speed if speed > 0 else 0.0
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, record, scheduled if speed > 0 else time.perf_counter())
+    wall = time.perf_counter() - start
+
+    def summary(rows):
+        return summarize([elapsed for _, elapsed, _ in rows], sum(1 for _, _, ok in rows if not ok), wall)
+
+    endpoints = sorted({endpoint for endpoint, _, _ in results})
+    ordered_lags = sorted(lags)
+    return {
+        "overall": summary(results),
+        "endpoints": {endpoint: summary([row for row in results if row[0] == endpoint]) for endpoint in endpoints},
+        "schedule_lag_ms": {"p95": percentile(ordered_lags, 95), "max": ordered_lags[-1] if ordered_lags else None},
+    }
+
+def _print_summary(name, summary):
+    latency = summary["latency_ms"]
+    print(f"{name:<10} n={summary['requests']:<6} p50={latency['p50']:.2f}ms p95={latency['p95']:.2f}ms "
+          f"p99={latency['p99']:.2f}ms {summary['throughput_rps']:.1f} req/s "
+          f"errors={summary['errors']} ({summary['error_rate']:.1%})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay captured NL -> SQL traffic")
+    parser.add_argument("logs", nargs="+", help="Capture files written via TRAFFIC_CAPTURE_PATH")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Multiple of the original request rate (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Most requests in flight at once")
+    parser.add_argument("--limit", type=int, help="Replay only the first N records")
+    parser.add_argument("--endpoints", default="/nl2sql,/query", help="Comma-separated endpoints to replay")
+    parser.add_argument("--base-url", help="Replay against an already running server instead of starting one")
+    parser.add_argument("--model", choices=("stub", "local"), default="stub",
+                        help="Model backend of the started server: deterministic stub (offline) or the real local model")
+    parser.add_argument("--rows", type=int, default=500, help="Rows in the synthetic database of the started server")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    endpoints = {name.strip() for name in args.endpoints.split(",") if name.strip()}
+    records = [record for record in load_records(args.logs) if record.get("endpoint") in endpoints]
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("No matching records found")
+        return 1
+    span = records[-1]["ts"] - records[0]["ts"]
+    print(f"Replaying {len(records)} requests captured over {span:.1f}s at {args.speed}x "
+          f"with concurrency {args.concurrency}")
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        workdir = tempfile.mkdtemp(prefix="nl2sql-replay-")
+        db_path = build_fixture_db(os.path.join(workdir, "replay.db"), rows=args.rows, seed=args.seed)
+        server, base_url = start_server(db_path, args.model)
+    try:
+        report = replay(records, base_url, speed=args.speed, concurrency=args.concurrency)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    _print_summary("overall", report["overall"])
+    for endpoint, summary in report["endpoints"].items():
+        _print_summary(endpoint, summary)
+    lag = report["schedule_lag_ms"]
+    print(f"send lag   p95={lag['p95']:.2f}ms max={lag['max']:.2f}ms")
+
+    if args.output:
+        report.update(
+            commit=git_commit(),
+            timestamp=datetime.now(timezone.utc).isoformat(),
+            config={
+                "logs": args.logs,
+                "records": len(records),
+                "speed": args.speed,
+                "concurrency": args.concurrency,
+                "model": args.model,
+                "base_url": args.base_url,
+            },
+        )
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Reproducible latency/throughput benchmarks for the NL -> SQL pipeline.
+
+Builds a synthetic facts_assessment database, then measures p50/p95/p99
+latency and throughput of the rule-based generator, the model stage, the
+hybrid pipeline and the HTTP endpoints at several concurrency levels.
+Results are written as JSON so runs on different commits can be compared.
+
+Examples:
+    python -m benchmarks.run --model stub
+    python -m benchmarks.run --model stub --targets rules,hybrid --concurrency 1,8
+    python -m benchmarks.run --model stub --compare bench_results/<previous>.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+
+from benchmarks.fixture import ROOT_DIR, build_fixture_db
+from benchmarks.stats import run_load
+
+RESULTS_SCHEMA_VERSION = 1
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions_v1.json')
+DEFAULT_OUTPUT_DIR = os.path.join(ROOT_DIR, 'bench_results')
+ALL_TARGETS = ("rules", "model", "hybrid", "http_nl2sql", "http_query")
+
+def load_corpus(path):
+    """Load a versioned question corpus"""
+    with open(path, 'r') as f:
+        corpus = json.load(f)
+    return corpus["version"], corpus["questions"]
+
+def git_commit():
+    """Current commit hash, or "unknown" outside a git checkout"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _snapshot_dir(db_path):
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), "snapshots")
+
+def start_server(db_path, model_backend, timeout=60):
+    """Start main:app under uvicorn against the fixture; returns (process, base_url)"""
+    port = _free_port()
+    # An empty snapshot directory next to the fixture, so a published snapshot
+    # in the working tree does not replace it
+    env = dict(os.environ, SQLITE_DB_PATH=db_path, SNAPSHOT_DIR=_snapshot_dir(db_path),
+               TEXT2SQL_MODEL_BACKEND=model_backend, LOG_LEVEL="OFF")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("uvicorn exited before the server came up")
+        try:
+            urllib.request.urlopen(base_url + "/", timeout=1).read()
+            return process, base_url
+        except Exception:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server did not start within {timeout}s")
+
+def _http_call(method, url, timeout=60):
+    """Perform one request; True when it returned 200 with no "error" key"""
+    request = urllib.request.Request(url, method=method)
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = json.loads(response.read())
+    return response.status == 200 and "error" not in body
+
+def build_targets(names, base_url):
+    """Map target name -> (call, items builder) for the requested targets"""
+    # Imported here so SQLITE_DB_PATH/SNAPSHOT_DIR/TEXT2SQL_MODEL_BACKEND are already set
+    import text2sql_hybrid
+    from text2sql_local_rules import sql_generator
+
+    targets = {
+        "rules": lambda q: bool(sql_generator.generate_sql(q)),
+        "model": lambda q: bool(text2sql_hybrid.model_generate_sql(q)),
+        "hybrid": lambda q: bool(text2sql_hybrid.hybrid_generate_sql(q)),
+    }
+    if base_url:
+        targets["http_nl2sql"] = lambda q: _http_call(
+            "POST", f"{base_url}/nl2sql?" + urllib.parse.urlencode({"question": q}))
+        targets["http_query"] = lambda sql: _http_call(
+            "GET", f"{base_url}/query?" + urllib.parse.urlencode({"sql": sql}))
+    return {name: targets[name] for name in names if name in targets}
+
+def compare_results(current, baseline, threshold_pct):
+    """Print p50/p95/throughput deltas against a baseline run; returns regressions"""
+    previous = {(r["target"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\nComparison against {baseline.get('commit', 'unknown')} (threshold {threshold_pct}%):")
+    for result in current["results"]:
+        key = (result["target"], result["concurrency"])
+        old = previous.get(key)
+        if not old:
+            continue
+
+        def delta(new_value, old_value):
+            return (new_value - old_value) / old_value * 100 if old_value else 0.0
+
+        p50 = delta(result["latency_ms"]["p50"], old["latency_ms"]["p50"])
+        p95 = delta(result["latency_ms"]["p95"], old["latency_ms"]["p95"])
+        rps = delta(result["throughput_rps"], old["throughput_rps"])
+        print(f"  {key[0]:<12} c={key[1]:<3} p50 {p50:+7.1f}%  p95 {p95:+7.1f}%  throughput {rps:+7.1f}%")
+        if p95 > threshold_pct or rps < -threshold_pct:
+            regressions.append(key)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="NL -> SQL latency/throughput benchmarks")
+    parser.add_argument("--targets", default=",".join(ALL_TARGETS),
+                        help=f"Comma-separated subset of: {', '.join(ALL_TARGETS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Measured calls per target and level")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=500, help="Rows in the synthetic database")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--model", choices=("stub", "local"), default="stub",
+                        help="Model backend: deterministic stub (offline) or the real local model")
+    parser.add_argument("--base-url", help="Benchmark an already running server instead of starting one")
+    parser.add_argument("--output", help="Result file (default: bench_results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--regression-threshold", type=float, default=10.0,
+                        help="Percent p95/throughput change counted as a regression")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.targets.split(",") if name.strip()]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    corpus_version, questions = load_corpus(args.corpus)
+
+    workdir = tempfile.mkdtemp(prefix="nl2sql-bench-")
+    db_path = build_fixture_db(os.path.join(workdir, "bench.db"), rows=args.rows, seed=args.seed)
+    os.environ["SQLITE_DB_PATH"] = db_path
+    os.environ["SNAPSHOT_DIR"] = _snapshot_dir(db_path)
+    os.environ["TEXT2SQL_MODEL_BACKEND"] = args.model
+    os.environ.setdefault("LOG_LEVEL", "OFF")
+    sys.path.insert(0, ROOT_DIR)
+    from observability import configure_logging
+    configure_logging()
+
+    server = None
+    base_url = args.base_url
+    if not base_url and any(name.startswith("http_") for name in names):
+        try:
+            server, base_url = start_server(db_path, args.model)
+        except Exception as e:
+            print(f"Skipping HTTP targets: {e}")
+
+    try:
+        targets = build_targets(names, base_url)
+        from text2sql_local_rules import sql_generator
+        query_items = [sql_generator.generate_sql(q) for q in questions]
+
+        results = []
+        for name, call in targets.items():
+            items = query_items if name == "http_query" else questions
+            for level in levels:
+                summary = run_load(call, items, level, args.requests, warmup=args.warmup)
+                summary.update(target=name, concurrency=level)
+                results.append(summary)
+                latency = summary["latency_ms"]
+                print(f"{name:<12} c={level:<3} p50={latency['p50']:.2f}ms p95={latency['p95']:.2f}ms "
+                      f"p99={latency['p99']:.2f}ms {summary['throughput_rps']:.1f} req/s "
+                      f"errors={summary['errors']}")
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    commit = git_commit()
+    report = {
+        "schema_version": RESULTS_SCHEMA_VERSION,
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "config": {
+            "model": args.model,
+            "rows": args.rows,
+            "seed": args.seed,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": levels,
+            "corpus": os.path.basename(args.corpus),
+            "corpus_version": corpus_version,
+            "base_url": args.base_url,
+        },
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_OUTPUT_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(DEFAULT_OUTPUT_DIR, f"{stamp}-{commit}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if compare_results(report, baseline, args.regression_threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""
+Load generation and latency statistics shared by the benchmark tools.
+"""
+
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list (None when empty)"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies_ms, errors, wall_seconds):
+    """Summarize per-call latencies (ms) into the result record fields"""
+    ordered = sorted(latencies_ms)
+    count = len(ordered)
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": errors / count if count else 0.0,
+        "throughput_rps": count / wall_seconds if wall_seconds > 0 else 0.0,
+        "latency_ms": {
+            "p50": percentile(ordered, 50),
+            "p95": percentile(ordered, 95),
+            "p99": percentile(ordered, 99),
+            "mean": sum(ordered) / count if count else None,
+            "max": ordered[-1] if ordered else None,
+        },
+    }
+
+def run_load(call, items, concurrency, total_requests, warmup=0):
+    """
+    Call call(item) total_requests times from `concurrency` threads.
+
+    Items are used round-robin. call returns True on success and False on
+    failure; exceptions also count as failures.
+
+    Returns:
+        summarize() output for the measured calls
+    """
+    for i in range(warmup):
+        try:
+            call(items[i % len(items)])
+        except Exception:
+            pass
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(total_requests))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            try:
+                ok = call(items[index % len(items)])
+            except Exception:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - start
+    return summarize(latencies, errors[0], wall)
@@ -0,0 +1,302 @@
+"""
+Shared SQLite access for the NL -> SQL services.
+
+Each worker thread keeps one long-lived connection, so sqlite3's per-connection
+prepared statement cache is reused across requests for the same SQL template.
+Query results are cached by (template, parameters).
+
+When a snapshot has been published (see snapshots.py) connections open it
+read-only and immutable with a large mmap instead of DB_PATH. refresh_snapshot()
+switches to a newly published snapshot between requests and lets registered
+callbacks rebuild derived in-memory state; each request stays pinned to the
+snapshot it started on. A snapshot carries the (state, district) keys that
+differ from the snapshot it replaced, and switching to it from that version
+only drops the cached results that could involve those keys.
+"""
+
+import contextvars
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import snapshots
+from observability import CACHE_HITS, CACHE_MISSES, Counter
+
+# Configuration
+DB_PATH = os.getenv('SQLITE_DB_PATH', 'local_data.db')
+STATEMENT_CACHE_SIZE = int(os.getenv('SQLITE_STATEMENT_CACHE_SIZE', '256'))
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '256'))
+SNAPSHOT_MMAP_SIZE = int(os.getenv('SNAPSHOT_MMAP_SIZE', str(256 * 1024 * 1024)))
+# Seconds between checks of the snapshot pointer
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', '1.0'))
+
+SNAPSHOT_SWITCHES = Counter(
+    "db_snapshot_switches_total",
+    "Times the workers switched to a newly published data snapshot.",
+)
+
+def _resolve_source():
+    """The current snapshot if one is published, else the writable DB_PATH"""
+    current = snapshots.read_current()
+    if current:
+        version, path = current
+        return {"version": version, "path": path, "snapshot": True}
+    return {"version": None, "path": DB_PATH, "snapshot": False}
+
+_active = _resolve_source()
+_request_source = contextvars.ContextVar("request_source", default=None)
+_reload_callbacks = []
+_refresh_lock = threading.Lock()
+_last_check = 0.0
+_pointer_mtime = None
+_local = threading.local()
+
+def open_connection(path, snapshot=False, check_same_thread=True):
+    """Open a new connection; snapshots are opened read-only and immutable"""
+    if snapshot:
+        uri = Path(path).resolve().as_uri() + "?mode=ro&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=check_same_thread)
+        conn.execute(f"PRAGMA mmap_size={SNAPSHOT_MMAP_SIZE};")
+        return conn
+    return sqlite3.connect(path, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=check_same_thread)
+
+def active_source():
+    """Data source of the current request, or the latest one outside requests"""
+    return _request_source.get() or _active
+
+def get_connection():
+    """Return this thread's connection to the active source, opening it on first use"""
+    source = active_source()
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.source is not source:
+        if conn is not None:
+            conn.close()
+        conn = open_connection(source["path"], source["snapshot"])
+        _local.conn = conn
+        _local.source = source
+    return conn
+
+def on_source_change(callback):
+    """
+    Register callback(source, changes) to rebuild derived state when the snapshot switches
+
+    changes is the change manifest ({"inserted": [...], "updated": [...],
+    "deleted": [...]}) when the new snapshot was diffed against the previous
+    one, else None.
+    """
+    _reload_callbacks.append(callback)
+
+def refresh_snapshot(force=False):
+    """
+    Switch to a newly published snapshot if the pointer changed
+
+    Cheap enough to call before every request: the pointer file is only
+    stat'ed every SNAPSHOT_CHECK_INTERVAL seconds.
+
+    Returns:
+        True if the active source changed
+    """
+    global _active, _last_check, _pointer_mtime
+    now = time.monotonic()
+    if not force and now - _last_check < SNAPSHOT_CHECK_INTERVAL:
+        return False
+    with _refresh_lock:
+        _last_check = now
+        try:
+            mtime = os.stat(snapshots.pointer_path()).st_mtime_ns
+        except OSError:
+            mtime = None
+        if not force and mtime == _pointer_mtime:
+            return False
+        source = _resolve_source()
+        if source["path"] == _active["path"]:
+            _pointer_mtime = mtime
+            return False
+        changes = None
+        if source["snapshot"]:
+            manifest = snapshots.read_changes(source["path"])
+            # Only a manifest diffed against the version we serve describes every difference
+            if manifest and manifest["base_version"] == _active["version"]:
+                changes = manifest
+        # Rebuild derived structures from the new snapshot before any request sees it
+        for callback in _reload_callbacks:
+            callback(source, changes)
+        # Invalidate and switch under the cache lock, so a request still on the
+        # old snapshot cannot put stale rows in between (see ResultCache.put)
+        with result_cache._lock:
+            if changes is None:
+                result_cache.clear()
+            else:
+                changed = changes["inserted"] + changes["updated"] + changes.get("deleted", [])
+                result_cache.invalidate_locations(changed, source["path"])
+            _active = source
+        # Only now: if a callback failed, the next check retries the switch
+        _pointer_mtime = mtime
+        SNAPSHOT_SWITCHES.inc()
+        return True
+
+def pin_request_source():
+    """Pin the active source for the current request; returns a token for unpin"""
+    return _request_source.set(_active)
+
+def unpin_request_source(token):
+    _request_source.reset(token)
+
+def install(app):
+    """Add the middleware that keeps a FastAPI app on the latest published snapshot"""
+    from starlette.concurrency import run_in_threadpool
+
+    @app.middleware("http")
+    async def use_latest_snapshot(request, call_next):
+        # A due check stats the pointer and, on a switch, runs the reload
+        # callbacks' queries, so it runs in the threadpool, not on the event loop
+        if time.monotonic() - _last_check >= SNAPSHOT_CHECK_INTERVAL:
+            await run_in_threadpool(refresh_snapshot)
+        # The request stays on the snapshot that was current when it started
+        token = pin_request_source()
+        try:
+            return await call_next(request)
+        finally:
+            unpin_request_source(token)
+
+def _db_fingerprint(path=None):
+    """Cheap change marker for the database file (mtime, size)"""
+    try:
+        stat = os.stat(path or _active["path"])
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+class ResultCache:
+    """Thread-safe LRU cache of run_sql results keyed by (SQL template, parameters)"""
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Reentrant: refresh_snapshot() holds it across invalidation and the switch
+        self._lock = threading.RLock()
+        self._fingerprint = None
+
+    def _check_fingerprint(self):
+        # Drop everything if the database file was rewritten (e.g. by init_db.py)
+        fingerprint = _db_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._entries.clear()
+            self._fingerprint = fingerprint
+
+    def get(self, sql, params):
+        key = (sql, tuple(params))
+        with self._lock:
+            self._check_fingerprint()
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+        if result is None:
+            CACHE_MISSES.inc(cache="results")
+        else:
+            CACHE_HITS.inc(cache="results")
+        return result
+
+    def put(self, sql, params, result):
+        if self.max_entries <= 0:
+            return
+        key = (sql, tuple(params))
+        with self._lock:
+            # A request still pinned to a replaced snapshot must not cache its stale rows
+            if active_source() is not _active:
+                return
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate_locations(self, keys, path=None):
+        """
+        Drop the entries that may read rows of the given (state, district) keys
+
+        An entry survives only if it is a single plain SELECT whose WHERE
+        clause requires equality of the state or district column with a
+        parameter, and none of its string parameters names a changed state
+        or district; anything else (no location filter, OR, NOT, CASE,
+        subqueries) is dropped.
+
+        Args:
+            keys: Changed [state, district] pairs
+            path: Database file the surviving entries are valid for
+        """
+        names = {name.upper() for key in keys for name in key}
+        with self._lock:
+            for key in list(self._entries):
+                sql, params = key
+                if not _is_location_scoped(sql) or any(
+                        isinstance(value, str) and value.upper() in names for value in params):
+                    del self._entries[key]
+            self._fingerprint = _db_fingerprint(path)
+
+LOCATION_COLUMNS = ("STATE - 1_level_1", "DISTRICT - 2_level_1")
+# Constructs that could let a row outside a top-level location filter match
+_UNSCOPED_PATTERN = re.compile(r"\b(?:OR|NOT|CASE|BETWEEN)\b", re.IGNORECASE)
+# "<location column> = ?" as a whole conjunct of the outer WHERE clause
+_LOCATION_FILTER_PATTERN = re.compile(
+    r'\b(?:WHERE|AND)\s+"(?:' + "|".join(re.escape(column) for column in LOCATION_COLUMNS) + r')"\s*=\s*\?'
+    r'\s*(?:$|;|\b(?:AND|GROUP|ORDER|LIMIT)\b)',
+    re.IGNORECASE,
+)
+
+def _is_location_scoped(sql):
+    """Whether a cached query only reads rows of the locations bound to its parameters"""
+    return (sql.upper().count("SELECT") == 1
+            and not _UNSCOPED_PATTERN.search(_LITERAL_PATTERN.sub("", sql))
+            and _LOCATION_FILTER_PATTERN.search(sql) is not None)
+
+result_cache = ResultCache()
+
+# Single-quoted string literals ('' is an escaped quote); double-quoted
+# identifiers are matched too so quotes inside them are left alone
+_LITERAL_PATTERN = re.compile(r'"(?:[^"]|"")*"|\'(?:[^\']|\'\')*\'')
+_PLACEHOLDER_PATTERN = re.compile(r'"(?:[^"]|"")*"|\'(?:[^\']|\'\')*\'|\?')
+
+def parameterize_sql(sql):
+    """
+    Replace single-quoted string literals with ? placeholders.
+
+    Args:
+        sql: SQL text with inline literals, e.g. ... WHERE "STATE - 1_level_1" = 'TAMIL NADU'
+
+    Returns:
+        (template, params) where template has a ? for every literal
+    """
+    params = []
+
+    def replace(match):
+        token = match.group(0)
+        if token.startswith('"'):
+            return token
+        params.append(token[1:-1].replace("''", "'"))
+        return "?"
+
+    template = _LITERAL_PATTERN.sub(replace, sql)
+    return template, params
+
+def render_sql(sql, params):
+    """Inline bound parameters into a template (for display and copy/paste only)"""
+    values = iter(params)
+
+    def replace(match):
+        token = match.group(0)
+        if token != "?":
+            return token
+        value = next(values)
+        if isinstance(value, str):
+            return "'" + value.replace("'", "''") + "'"
+        return str(value)
+
+    return _PLACEHOLDER_PATTERN.sub(replace, sql)
@@ -0,0 +1,252 @@
+"""
+Streamed export of full query results as CSV or Parquet.
+
+Rows are read from the SQLite cursor EXPORT_CHUNK_ROWS at a time and written
+out chunk by chunk (one Parquet row group per chunk), so server memory stays
+bounded however many rows match. Parquet needs the optional pyarrow package.
+The same cursors feed /nl2sql/stream, which sends rows as NDJSON lines in
+smaller STREAM_CHUNK_ROWS chunks so the client can render them as they come.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import time
+
+from db import active_source, open_connection
+from observability import Counter
+from sql_guard import PROGRESS_INTERVAL, check_query_plan
+
+# Configuration
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '10000'))
+# Longest SQLite may work on the query at a time (starting it, or reading one chunk)
+EXPORT_TIMEOUT_MS = int(os.getenv('EXPORT_TIMEOUT_MS', '60000'))
+STREAM_CHUNK_ROWS = int(os.getenv('STREAM_CHUNK_ROWS', '100'))
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+EXPORTS = Counter(
+    "exports_total",
+    "Streamed exports by format and outcome.",
+    ["format", "outcome"],
+)
+
+# A trailing LIMIT/OFFSET clause, as added to every generated query
+_TRAILING_LIMIT_PATTERN = re.compile(r"\s+LIMIT\s+\d+(?:\s*(?:,|OFFSET)\s*\d+)?\s*;?\s*$", re.IGNORECASE)
+
+def strip_limit(sql):
+    """Drop a trailing LIMIT clause so the full result is exported"""
+    return _TRAILING_LIMIT_PATTERN.sub("", sql.strip().rstrip(";"))
+
+def _set_deadline(conn, timeout_ms=EXPORT_TIMEOUT_MS):
+    """
+    Abort the connection's next SQLite call once it runs past timeout_ms
+
+    Re-armed before every call, so the time the client takes to download
+    earlier chunks never counts against the query.
+    """
+    deadline = time.monotonic() + timeout_ms / 1000
+    conn.set_progress_handler(lambda: int(time.monotonic() > deadline), PROGRESS_INTERVAL)
+
+def open_export(sql, params=()):
+    """
+    Check the plan and start the query on a dedicated connection
+
+    The connection may be used from several threads in turn while the
+    response streams, but never concurrently.
+
+    Returns:
+        (cursor, columns) on success, or an error message string
+    """
+    source = active_source()
+    conn = open_connection(source["path"], source["snapshot"], check_same_thread=False)
+    try:
+        plan_error = check_query_plan(conn, sql, params)
+        if plan_error:
+            conn.close()
+            return plan_error
+
+        _set_deadline(conn)
+        cursor = conn.execute(sql, params)
+    except sqlite3.Error as e:
+        conn.close()
+        return str(e)
+    return cursor, [desc[0] for desc in cursor.description]
+
+def _chunks(cursor, size=EXPORT_CHUNK_ROWS):
+    try:
+        while True:
+            _set_deadline(cursor.connection)
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.connection.close()
+
+def stream_csv(cursor, columns):
+    """Yield the result as UTF-8 CSV, one chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    try:
+        for rows in _chunks(cursor):
+            writer.writerows(rows)
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+        if buffer.tell():
+            yield buffer.getvalue().encode('utf-8')
+    except Exception:
+        EXPORTS.inc(format="csv", outcome="error")
+        raise
+    EXPORTS.inc(format="csv", outcome="ok")
+
+def stream_ndjson(cursor, columns, header, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Yield a query result as newline-delimited JSON
+
+    The first line is header with "type": "query", followed by "rows" lines
+    carrying "columns" and a list of row lists, and a final "done" line with
+    the row count. A failure while reading ends the stream with an "error" line.
+    """
+    yield json.dumps(dict(header, type="query")) + "\n"
+    row_count = 0
+    try:
+        for rows in _chunks(cursor, chunk_rows):
+            row_count += len(rows)
+            yield json.dumps({"type": "rows", "columns": columns, "rows": rows}) + "\n"
+    except sqlite3.Error as e:
+        yield json.dumps({"type": "error", "error": f"SQL execution error: {e}"}) + "\n"
+        return
+    yield json.dumps({"type": "done", "row_count": row_count}) + "\n"
+
+class _StreamSink:
+    """Write-only file for pyarrow that hands out what was written since the last take()"""
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _declared_types(conn, columns):
+    """Declared SQLite type of each result column that names a table column, else None"""
+    declared = {}
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table';")]
+    for table in tables:
+        for row in conn.execute(f'PRAGMA table_info("{table}");'):
+            declared.setdefault(row[1], row[2])
+    return [declared.get(name) for name in columns]
+
+def _arrow_type(pa, declared, values):
+    """
+    Arrow type for a column, wide enough for every value SQLite may return
+
+    The declared type decides (by SQLite's affinity rules); for expressions
+    and untyped columns the first non-NULL value of the first chunk does.
+    All numbers become float64 and anything unknown a string, since the
+    schema is fixed once the first row group is written.
+    """
+    declared = (declared or "").upper()
+    if any(name in declared for name in ("INT", "REAL", "FLOA", "DOUB", "NUM", "DEC")):
+        return pa.float64()
+    if any(name in declared for name in ("CHAR", "CLOB", "TEXT")):
+        return pa.string()
+    for value in values:
+        if isinstance(value, (int, float)):
+            return pa.float64()
+        if isinstance(value, bytes):
+            return pa.binary()
+        if value is not None:
+            return pa.string()
+    return pa.string()
+
+def _arrow_array(pa, values, arrow_type):
+    """Arrow array of one chunk of a column, converting values that do not match its type"""
+    if arrow_type == pa.string():
+        values = [value if value is None or isinstance(value, str)
+                  else value.decode('utf-8', 'replace') if isinstance(value, bytes)
+                  else str(value) for value in values]
+    elif arrow_type == pa.binary():
+        values = [value if value is None or isinstance(value, bytes) else str(value).encode('utf-8')
+                  for value in values]
+    return pa.array(values, type=arrow_type)
+
+def stream_parquet(cursor, columns, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yield the result as a Parquet file, one row group per chunk of rows
+
+    Column types come from the declared column types, or from the first
+    chunk for expressions (SQLite has no declared result types); later
+    chunks are converted to them.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _StreamSink()
+    writer = None
+    try:
+        declared = _declared_types(cursor.connection, columns)
+        for rows in _chunks(cursor, chunk_rows):
+            values = list(zip(*rows))
+            if writer is None:
+                schema = pa.schema([(name, _arrow_type(pa, decl, column))
+                                    for name, decl, column in zip(columns, declared, values)])
+                writer = pq.ParquetWriter(sink, schema)
+            arrays = [_arrow_array(pa, column, field.type) for column, field in zip(values, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.take()
+        if writer is None:
+            # No rows matched: still produce a valid file with the column names
+            schema = pa.schema([(name, _arrow_type(pa, decl, ())) for name, decl in zip(columns, declared)])
+            writer = pq.ParquetWriter(sink, schema)
+        writer.close()
+        yield sink.take()
+    except Exception:
+        EXPORTS.inc(format="parquet", outcome="error")
+        raise
+    EXPORTS.inc(format="parquet", outcome="ok")
+
+if __name__ == "__main__":
+    # A REAL column that is NULL for the whole first chunk, and an untyped
+    # one that switches from integers to floats, still give a valid file
+    import pyarrow.parquet as pq
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute('CREATE TABLE facts (district TEXT, level REAL, score);')
+    conn.executemany("INSERT INTO facts VALUES (?, ?, ?);",
+                     [("A", None, 1), ("B", None, 2), ("C", 1.5, 2.5), ("D", 2.0, 3)])
+    cursor = conn.execute("SELECT district, level, score, level * 2 AS doubled FROM facts;")
+    columns = [desc[0] for desc in cursor.description]
+    table = pq.read_table(io.BytesIO(b"".join(stream_parquet(cursor, columns, chunk_rows=2))))
+    assert table.column("level").to_pylist() == [None, None, 1.5, 2.0]
+    assert table.column("score").to_pylist() == [1.0, 2.0, 2.5, 3.0]
+    assert table.column("doubled").to_pylist() == [None, None, "3.0", "4.0"]
+    print("Parquet export checks passed")
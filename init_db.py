@@ -2,19 +2,34 @@
 Database initialization script.
 This script creates the SQLite database and imports data from CSV.
 Only run this if you don't have the local_data.db file.
+
+With --snapshot the rebuilt database is also published as a new read-only
+snapshot (see snapshots.py); running servers switch to it between requests
+without a restart.
+
+With --delta FILE.csv only the rows in a partial CSV are upserted, keyed by
+state + district, and the changed keys are reported.
 """
 
+import csv
+import json
 import os
 import sqlite3
-import pandas as pd
+from snapshots import publish_snapshot, SNAPSHOT_DIR
 
 # Configuration
 DB_PATH = 'local_data.db'
 SCHEMA_PATH = 'facts_assessment_schema.sql'
 CSV_PATH = 'cleaned_groundwater_data_final.csv'
+TABLE_NAME = 'facts_assessment'
+STATE_COLUMN = 'STATE - 1_level_1'
+DISTRICT_COLUMN = 'DISTRICT - 2_level_1'
+KEY_INDEX = 'idx_facts_assessment_state_district'
 
 def init_db():
     """Initialize SQLite database with schema and data"""
+    import pandas as pd
+    
     print(f"Initializing database at {DB_PATH}...")
     
     # Create database with schema
@@ -45,5 +60,117 @@ def init_db():
     conn.close()
     print("Database initialization complete!")
 
+def _convert(value, declared_type):
+    """Convert a CSV string to the column's storage type (empty -> NULL)"""
+    if value is None or value.strip() == "":
+        return None
+    declared_type = declared_type.upper()
+    try:
+        if "INT" in declared_type:
+            return int(value)
+        if any(t in declared_type for t in ("REAL", "FLOA", "DOUB", "NUM")):
+            return float(value)
+    except ValueError:
+        pass
+    return value
+
+def delta_import(csv_path, db_path=DB_PATH):
+    """
+    Upsert the rows of a partial CSV into facts_assessment
+    
+    Rows are keyed by state + district. Only the columns present in the CSV
+    are written, so a file can carry just the figures that changed. Unchanged
+    rows are not rewritten, so only the index entries of changed rows are
+    touched.
+    
+    Args:
+        csv_path: Partial CSV with the state and district columns plus any
+            subset of the other facts_assessment columns
+        db_path: Database to update
+        
+    Returns:
+        dict with "inserted" and "updated" lists of [state, district] keys
+        and the "unchanged" row count
+    """
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        columns = reader.fieldnames or []
+        rows = list(reader)
+    
+    if STATE_COLUMN not in columns or DISTRICT_COLUMN not in columns:
+        raise ValueError(f"Delta CSV must contain the \"{STATE_COLUMN}\" and \"{DISTRICT_COLUMN}\" columns")
+    
+    conn = sqlite3.connect(db_path)
+    try:
+        table_types = {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({TABLE_NAME});")}
+        unknown = [col for col in columns if col not in table_types]
+        if unknown:
+            raise ValueError(f"Unknown columns in delta CSV: {', '.join(unknown)}")
+        
+        # The key index makes each lookup a single index search
+        try:
+            conn.execute(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS {KEY_INDEX} '
+                f'ON {TABLE_NAME} ("{STATE_COLUMN}", "{DISTRICT_COLUMN}");'
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError("facts_assessment has duplicate state + district rows; rebuild it with init_db.py first")
+        
+        value_columns = [col for col in columns if col not in (STATE_COLUMN, DISTRICT_COLUMN)]
+        key_filter = f'WHERE "{STATE_COLUMN}" = ? AND "{DISTRICT_COLUMN}" = ?'
+        quoted_values = [f'"{col}"' for col in value_columns]
+        quoted_all = [f'"{STATE_COLUMN}"', f'"{DISTRICT_COLUMN}"'] + quoted_values
+        select_sql = f'SELECT {", ".join(quoted_values) or "1"} FROM {TABLE_NAME} {key_filter};'
+        insert_sql = (f'INSERT INTO {TABLE_NAME} ({", ".join(quoted_all)}) '
+                      f'VALUES ({", ".join("?" for _ in quoted_all)});')
+        update_sql = f'UPDATE {TABLE_NAME} SET {", ".join(col + " = ?" for col in quoted_values)} {key_filter};'
+        
+        report = {"inserted": [], "updated": [], "unchanged": 0}
+        with conn:
+            for row in rows:
+                state = row[STATE_COLUMN].strip()
+                district = row[DISTRICT_COLUMN].strip()
+                values = [_convert(row[col], table_types[col]) for col in value_columns]
+                existing = conn.execute(select_sql, (state, district)).fetchone()
+                if existing is None:
+                    conn.execute(insert_sql, [state, district] + values)
+                    report["inserted"].append([state, district])
+                elif value_columns and list(existing) != values:
+                    conn.execute(update_sql, values + [state, district])
+                    report["updated"].append([state, district])
+                else:
+                    report["unchanged"] += 1
+    finally:
+        conn.close()
+    return report
+
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Build the groundwater SQLite database")
+    parser.add_argument("--snapshot", action="store_true",
+                        help=f"Publish the result as a new read-only snapshot in {SNAPSHOT_DIR}")
+    parser.add_argument("--delta", metavar="CSV",
+                        help="Upsert the rows of a partial CSV (keyed by state + district) instead of a full rebuild")
+    parser.add_argument("--report", metavar="JSON", help="Write the changed keys of a --delta import to this file")
+    args = parser.parse_args()
+    
+    if args.delta:
+        changes = delta_import(args.delta)
+        print(f"Delta import from {args.delta}: {len(changes['inserted'])} inserted, "
+              f"{len(changes['updated'])} updated, {changes['unchanged']} unchanged")
+        for state, district in changes["inserted"]:
+            print(f"  inserted: {state} / {district}")
+        for state, district in changes["updated"]:
+            print(f"  updated: {state} / {district}")
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump(changes, f, indent=2)
+    else:
+        init_db()
+    
+    if args.snapshot:
+        # The snapshot carries the keys that differ from the current one so
+        # servers can invalidate only the cached results for those locations
+        version = publish_snapshot(DB_PATH, table=TABLE_NAME, key_columns=(STATE_COLUMN, DISTRICT_COLUMN))
+        print(f"Published snapshot {version} to {SNAPSHOT_DIR}")
\ No newline at end of file
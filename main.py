@@ -1,16 +1,35 @@
 import sqlite3
 from fastapi import FastAPI, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from typing import List
 import os
+import json
 from dotenv import load_dotenv
-# Import the hybrid SQL generator that uses both model and rules
-from text2sql_hybrid import generate_sql, run_sql
 
+# Load .env before importing the generators so NL2SQL_MODE and friends apply
 load_dotenv()
 
+# Import the hybrid SQL generator that uses both model and rules
+from text2sql_hybrid import generate_query, generate_queries, normalize_question, run_sql, new_trace, format_trace, load_model_backend, NL2SQL_MODE
+from observability import configure_logging, render_metrics
+from sql_guard import execute_guarded
+from db import active_source, render_sql, install as install_snapshot_refresh
+from singleflight import SingleFlight
+from traffic_capture import annotate, install as install_traffic_capture
+from export import EXPORT_FORMATS, NDJSON_MEDIA_TYPE, open_export, stream_csv, stream_ndjson, stream_parquet, strip_limit
+
+configure_logging()
+
 app = FastAPI()
 
 DB_PATH = os.getenv('SQLITE_DB_PATH', 'local_data.db')
 SCHEMA_PATH = 'facts_assessment_schema.sql'
+BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', '1000'))
+
+# Identical concurrent requests share one computation
+nl2sql_flight = SingleFlight("nl2sql")
+query_flight = SingleFlight("query")
 
 # Initialize SQLite DB and create table if not exists
 conn = sqlite3.connect(DB_PATH)
@@ -24,70 +43,194 @@ if not cursor.fetchone():
     conn.commit()
 conn.close()
 
+# Opt-in request capture for replay (TRAFFIC_CAPTURE_PATH)
+install_traffic_capture(app)
+
+# Switch to newly published data snapshots between requests
+install_snapshot_refresh(app)
+
+@app.on_event("startup")
+def preload_model_backend():
+    # In hybrid mode pay the torch/transformers import at startup rather than on
+    # the first request; rules-only mode never imports them
+    if NL2SQL_MODE != "rules":
+        load_model_backend()
+
 @app.post("/nl2sql")
 def nl2sql(question: str, debug: bool = False):
+    # Keyed by snapshot version too, so requests pinned to different data never share
+    key = (active_source()["version"], normalize_question(question), debug)
+    response = nl2sql_flight.do(key, answer_question, question, debug)
+    annotate(path=response.get("path"), rows=len(response.get("data", [])), error="error" in response)
+    return response
+
+def prepare_question(question, debug=False):
+    """Generate the SQL for one question; returns its sql/params/raw_output (and trace), or an "error" dict"""
+    # Generate SQL using our hybrid approach (model with rule-based fallback)
     try:
-        # Generate SQL using our hybrid approach (model with rule-based fallback)
-        try:
-            sql = generate_sql(question)
-            raw_output = f"Generated SQL using hybrid approach (model with rule-based fallback): {sql}"
-            
-            # Collect debug info if requested
-            if debug:
-                from text2sql_local import generate_sql as model_only
-                from text2sql_local_rules import generate_sql as rules_only
-                
-                try:
-                    model_sql = model_only(question)
-                    raw_output += f"\n\nModel only (before enhancements): {model_sql}"
-                except Exception as e:
-                    raw_output += f"\n\nModel failed: {str(e)}"
-                    
-                # Show rule-based output for comparison
-                try:
-                    rule_sql = rules_only(question)
-                    raw_output += f"\n\nRule-based: {rule_sql}"
-                except Exception as e:
-                    raw_output += f"\n\nRule-based failed: {str(e)}"
-                
-        except Exception as e:
-            return {"error": f"Failed to generate SQL: {str(e)}", 
-                    "raw_output": str(e)}
+        # The hybrid pipeline fills in the trace as it runs, so debug output
+        # never needs to run the model or the rules a second time
+        trace = new_trace(question)
+        query = generate_query(question, trace)
+        sql, params = query["sql"], query["params"]
+        raw_output = ("Generated SQL using hybrid approach (model with rule-based fallback): "
+                      f"{render_sql(sql, params)}")
+        
+        # Collect debug info if requested
+        if debug:
+            raw_output += "\n\n" + format_trace(trace)
             
-        # Only allow SELECT queries
-        if not sql.strip().lower().startswith("select"):
-            return {"error": "Only SELECT queries are allowed.", "sql": sql, "raw_output": raw_output}
+    except Exception as e:
+        return {"error": f"Failed to generate SQL: {str(e)}", 
+                "raw_output": str(e)}
+        
+    # Only allow SELECT queries
+    if not sql.strip().lower().startswith("select"):
+        return {"error": "Only SELECT queries are allowed.", "sql": sql, "raw_output": raw_output}
+    
+    prepared = {"sql": sql, "params": params, "path": trace["path"], "raw_output": raw_output}
+    if debug:
+        prepared["trace"] = trace
+    return prepared
+
+def answer_question(question, debug=False):
+    """Generate and run the SQL for one question; returns the /nl2sql response"""
+    try:
+        prepared = prepare_question(question, debug)
+        if "error" in prepared:
+            return prepared
         
-        # Run the SQL query
-        result = run_sql(sql)
+        # Run the SQL query with its bound parameters
+        result = run_sql(prepared["sql"], prepared["params"])
         
         if result["success"]:
-            return {
-                "sql": sql,
-                "data": result["data"],
-                "columns": result["columns"],
-                "raw_output": raw_output
-            }
-        else:
-            return {"error": f"SQL execution error: {result['error']}", "sql": sql, "raw_output": raw_output}
+            return dict(prepared, data=result["data"], columns=result["columns"])
+        return dict(prepared, error=f"SQL execution error: {result['error']}")
             
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}", "raw_output": str(e)}
 
+@app.post("/nl2sql/stream")
+def nl2sql_stream(question: str, debug: bool = False):
+    """
+    Like /nl2sql, but streams newline-delimited JSON so clients can render
+    progressively: a "query" line with the SQL as soon as it is generated,
+    then "rows" lines as they are read, then a "done" (or "error") line.
+    """
+    key = (active_source()["version"], normalize_question(question), debug, "stream")
+    prepared = nl2sql_flight.do(key, prepare_question, question, debug)
+    if "error" in prepared:
+        lines = [json.dumps(dict(prepared, type="error")) + "\n"]
+        return StreamingResponse(iter(lines), media_type=NDJSON_MEDIA_TYPE)
+    
+    opened = open_export(prepared["sql"], prepared["params"])
+    if isinstance(opened, str):
+        error = dict(prepared, type="error", error=f"SQL execution error: {opened}")
+        return StreamingResponse(iter([json.dumps(error) + "\n"]), media_type=NDJSON_MEDIA_TYPE)
+    cursor, columns = opened
+    return StreamingResponse(stream_ndjson(cursor, columns, prepared), media_type=NDJSON_MEDIA_TYPE)
+
+class BatchRequest(BaseModel):
+    questions: List[str]
+    debug: bool = False
+
+@app.post("/nl2sql/batch")
+def nl2sql_batch(request: BatchRequest):
+    """Convert and run many questions in one call, with results and errors per question"""
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        return {"error": f"At most {BATCH_MAX_QUESTIONS} questions are allowed per batch."}
+    
+    # De-duplicate so each distinct question is generated and run only once
+    unique = {}
+    for question in request.questions:
+        unique.setdefault(normalize_question(question), question)
+    keys = list(unique)
+    
+    try:
+        generated = generate_queries([unique[key] for key in keys])
+    except Exception as e:
+        return {"error": f"Failed to generate SQL: {str(e)}"}
+    
+    # All queries run on this worker's shared connection
+    items = {}
+    for key, (query, trace) in zip(keys, generated):
+        if query is None:
+            item = {"error": trace.get("error", "Failed to generate SQL")}
+        elif not query["sql"].strip().lower().startswith("select"):
+            item = {"error": "Only SELECT queries are allowed.", "sql": query["sql"], "params": query["params"]}
+        else:
+            result = run_sql(query["sql"], query["params"])
+            item = {"sql": query["sql"], "params": query["params"], "path": trace["path"]}
+            if result["success"]:
+                item.update(data=result["data"], columns=result["columns"])
+            else:
+                item["error"] = f"SQL execution error: {result['error']}"
+        if request.debug:
+            item["trace"] = trace
+        items[key] = item
+    
+    results = [dict(items[normalize_question(question)], question=question) for question in request.questions]
+    return {"results": results, "unique_questions": len(keys)}
+
 @app.get("/query")
 def run_query(sql: str = Query(..., description="SELECT-only SQL query")):
+    if not sql.strip().lower().startswith("select"):
+        annotate(error=True)
+        return {"error": "Only SELECT queries are allowed."}
+    # Raw SQL runs under the plan check and the time, VM-step and row budgets
+    result = query_flight.do((active_source()["version"], sql), execute_guarded, sql)
+    if not result["success"]:
+        annotate(error=True)
+        return {"error": result["error"]}
+    annotate(rows=len(result["data"]), truncated=result["truncated"], error=False)
+    return {"data": result["data"], "truncated": result["truncated"], "row_limit": result["row_limit"]}
+
+@app.get("/export")
+def export(sql: str = Query(..., description="SELECT-only SQL query or generated template"),
+           params: str = Query("[]", description="JSON list of values for the ? placeholders"),
+           format: str = Query("csv", description="csv or parquet"),
+           full: bool = Query(False, description="Drop a trailing LIMIT (e.g. of generated SQL) and export every row")):
+    """Stream the complete result of a query as CSV or Parquet"""
+    if format not in EXPORT_FORMATS:
+        return {"error": f"Unsupported format {format!r}; use one of: {', '.join(EXPORT_FORMATS)}"}
     if not sql.strip().lower().startswith("select"):
         return {"error": "Only SELECT queries are allowed."}
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.execute(sql)
-    columns = [desc[0] for desc in cursor.description]
-    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
-    conn.close()
-    return {"data": rows}
+    try:
+        values = json.loads(params)
+    except ValueError:
+        return {"error": "params must be a JSON list"}
+    if not isinstance(values, list):
+        return {"error": "params must be a JSON list"}
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return {"error": "Parquet export requires the pyarrow package."}
+    
+    if full:
+        sql = strip_limit(sql)
+    opened = open_export(sql, values)
+    if isinstance(opened, str):
+        return {"error": opened}
+    cursor, columns = opened
+    
+    stream = stream_parquet if format == "parquet" else stream_csv
+    return StreamingResponse(
+        stream(cursor, columns),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="query_results.{format}"'},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus-style metrics for the NL -> SQL pipeline"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 def root():
-    return {"message": "SQLite Facts Assessment API is running with hybrid PICARD+T5-small and rule-based NL → SQL conversion."}
+    if NL2SQL_MODE == "rules":
+        return {"message": "SQLite Facts Assessment API is running with rule-based NL → SQL conversion only.", "mode": NL2SQL_MODE}
+    return {"message": "SQLite Facts Assessment API is running with hybrid PICARD+T5-small and rule-based NL → SQL conversion.", "mode": NL2SQL_MODE}
 
 if __name__ == "__main__":
     import os
@@ -0,0 +1,163 @@
+"""
+Lightweight metrics and logging for the NL -> SQL services.
+Metrics live in process memory and are rendered in the Prometheus text
+format by the /metrics endpoint of main.py and app.py. No external
+dependencies are needed.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from fast rule matching up to slow beam search
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+def _format_labels(labelnames, values, extra=None):
+    """Format label pairs as {a="x",b="y"} (empty string when there are none)"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Counter:
+    """Monotonically increasing counter with optional labels"""
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    """Bucketed histogram of observed values (seconds for latencies)"""
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts, sum, count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+# Metrics shared by the hybrid pipeline, the model, the rules and the API servers
+STAGE_SECONDS = Histogram(
+    "nl2sql_stage_seconds",
+    "Time spent in each NL -> SQL pipeline stage.",
+    ["stage"],
+)
+GENERATIONS = Counter(
+    "nl2sql_generations_total",
+    "SQL generations by the path that produced the final query.",
+    ["path"],
+)
+FALLBACKS = Counter(
+    "nl2sql_fallbacks_total",
+    "Times the hybrid pipeline fell back to rule-based generation.",
+    ["reason"],
+)
+VALIDATION_FAILURES = Counter(
+    "nl2sql_validation_failures_total",
+    "Generated SQL that failed validation.",
+    ["stage"],
+)
+CACHE_HITS = Counter(
+    "nl2sql_cache_hits_total",
+    "Cache lookups that were served from a cache.",
+    ["cache"],
+)
+CACHE_MISSES = Counter(
+    "nl2sql_cache_misses_total",
+    "Cache lookups that had to compute the value.",
+    ["cache"],
+)
+
+@contextmanager
+def timed(stage):
+    """Record the wall time of the enclosed block in nl2sql_stage_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+def render_metrics():
+    """Render every registered metric in the Prometheus text exposition format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def configure_logging(level=None):
+    """
+    Configure logging for the services from LOG_LEVEL.
+
+    LOG_LEVEL accepts the standard names (DEBUG, INFO, WARNING, ...) or OFF,
+    which disables logging completely so nothing is formatted or written on
+    the request path.
+    """
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    if level == "OFF":
+        logging.disable(logging.CRITICAL)
+        return
+    logging.disable(logging.NOTSET)
+    logging.basicConfig(level=getattr(logging, level, logging.INFO),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
@@ -0,0 +1,62 @@
+"""
+Single-flight coalescing of identical concurrent requests.
+
+When many users ask the same question at once (e.g. a dashboard tile
+refreshing for everyone), only the first request runs the model and the SQL;
+the others wait for it and share its result. Nothing is cached once the
+computation finishes; that is the result cache's job.
+"""
+
+import threading
+
+from observability import Counter
+
+COALESCED = Counter(
+    "requests_coalesced_total",
+    "Requests that waited for an identical in-flight request and shared its result.",
+    ["group"],
+)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Run func once per key among concurrent callers
+
+    Callers passing a key that is already in flight block until that call
+    finishes and get its return value (or its exception). Results are shared,
+    so they must not be mutated by the callers.
+    """
+    def __init__(self, group):
+        self.group = group
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED.inc(group=self.group)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
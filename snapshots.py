@@ -0,0 +1,169 @@
+"""
+Versioned, read-only database snapshots.
+
+init_db.py builds the database as usual and then publishes a copy of it as an
+immutable snapshot file in SNAPSHOT_DIR. The CURRENT file in that directory
+names the active snapshot and is replaced atomically, so readers always see
+either the old or the new version, never a half-written one. Old snapshot
+files stay on disk (up to SNAPSHOT_KEEP) so in-flight requests can finish
+on the version they started with.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+# Configuration
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+SNAPSHOT_KEEP = int(os.getenv('SNAPSHOT_KEEP', '3'))
+POINTER_NAME = "CURRENT"
+SNAPSHOT_PREFIX = "facts-"
+SNAPSHOT_SUFFIX = ".db"
+
+def pointer_path(snapshot_dir=SNAPSHOT_DIR):
+    return os.path.join(snapshot_dir, POINTER_NAME)
+
+def read_current(snapshot_dir=SNAPSHOT_DIR):
+    """
+    Read the active snapshot pointer
+
+    Returns:
+        (version, path) of the current snapshot, or None if none is published
+    """
+    try:
+        with open(pointer_path(snapshot_dir), 'r') as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    if not name:
+        return None
+    return name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)], os.path.join(snapshot_dir, name)
+
+def changes_path(snapshot_path):
+    return snapshot_path[:-len(SNAPSHOT_SUFFIX)] + ".changes.json"
+
+def read_changes(snapshot_path):
+    """
+    Read the change manifest published with a snapshot
+
+    Returns:
+        {"base_version": ..., "inserted": [...], "updated": [...],
+        "deleted": [...]} or None if the snapshot has none
+    """
+    try:
+        with open(changes_path(snapshot_path), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def diff_keys(base_path, new_path, table, key_columns):
+    """
+    Keys of the rows of table that differ between two databases
+
+    Returns:
+        {"inserted": [...], "updated": [...], "deleted": [...]} lists of key
+        value lists, or None if the table's columns differ
+    """
+    conn = sqlite3.connect(new_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS base;", (base_path,))
+        columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table});")]
+        if not columns or columns != [row[1] for row in conn.execute(f"PRAGMA base.table_info({table});")]:
+            return None
+        keys = ", ".join('"' + column.replace('"', '""') + '"' for column in key_columns)
+
+        def key_set(sql):
+            return {tuple(row) for row in conn.execute(sql)}
+
+        inserted = key_set(f"SELECT {keys} FROM main.{table} EXCEPT SELECT {keys} FROM base.{table};")
+        deleted = key_set(f"SELECT {keys} FROM base.{table} EXCEPT SELECT {keys} FROM main.{table};")
+        changed = key_set(
+            f"SELECT {keys} FROM (SELECT * FROM main.{table} EXCEPT SELECT * FROM base.{table}) "
+            f"UNION SELECT {keys} FROM (SELECT * FROM base.{table} EXCEPT SELECT * FROM main.{table});"
+        )
+    finally:
+        conn.close()
+    return {
+        "inserted": sorted(list(key) for key in inserted),
+        "updated": sorted(list(key) for key in changed - inserted - deleted),
+        "deleted": sorted(list(key) for key in deleted),
+    }
+
+def publish_snapshot(source_db, snapshot_dir=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP, table=None, key_columns=None):
+    """
+    Copy source_db into a new immutable snapshot and make it current
+
+    Args:
+        source_db: Path of the freshly built database to publish
+        snapshot_dir: Directory holding snapshot files and the CURRENT pointer
+        keep: Number of snapshot files to retain (the current one included)
+        table, key_columns: When given and a snapshot is already current,
+            the new snapshot's table is diffed against it and the changed
+            keys are stored next to it with the version they apply to, so
+            servers switching from exactly that version can invalidate
+            only those keys
+
+    Returns:
+        Version string of the published snapshot
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    name = f"{SNAPSHOT_PREFIX}{version}{SNAPSHOT_SUFFIX}"
+    final_path = os.path.join(snapshot_dir, name)
+    tmp_path = final_path + ".tmp"
+
+    # Online backup gives a consistent copy even if the source is being read
+    source = sqlite3.connect(source_db)
+    target = sqlite3.connect(tmp_path)
+    try:
+        source.backup(target)
+        # Snapshots are opened with immutable=1, so they must not rely on a journal
+        target.execute("PRAGMA journal_mode=DELETE;")
+    finally:
+        target.close()
+        source.close()
+    os.replace(tmp_path, final_path)
+
+    previous = read_current(snapshot_dir)
+    if key_columns and previous and os.path.exists(previous[1]):
+        # Diff against what servers actually serve, so changes made to
+        # source_db since the last publish are covered too
+        manifest = diff_keys(previous[1], final_path, table, key_columns)
+        if manifest is not None:
+            manifest["base_version"] = previous[0]
+            with open(changes_path(final_path), 'w') as f:
+                json.dump(manifest, f)
+
+    # Atomically point CURRENT at the new snapshot
+    tmp_pointer = pointer_path(snapshot_dir) + ".tmp"
+    with open(tmp_pointer, 'w') as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_pointer, pointer_path(snapshot_dir))
+
+    prune_snapshots(snapshot_dir, keep)
+    return version
+
+def prune_snapshots(snapshot_dir=SNAPSHOT_DIR, keep=SNAPSHOT_KEEP):
+    """Delete the oldest snapshot files beyond `keep`, never the current one"""
+    current = read_current(snapshot_dir)
+    current_path = current[1] if current else None
+    names = sorted(
+        name for name in os.listdir(snapshot_dir)
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX)
+    )
+    for name in names[:max(0, len(names) - keep)]:
+        path = os.path.join(snapshot_dir, name)
+        if path == current_path:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # Still open somewhere (e.g. on Windows); try again on the next publish
+            continue
+        try:
+            os.remove(changes_path(path))
+        except OSError:
+            pass
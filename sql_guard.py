@@ -0,0 +1,136 @@
+"""
+Execution budgets for raw SQL submitted to the /query endpoints.
+
+A query is first checked with EXPLAIN QUERY PLAN and rejected if the plan is
+clearly too expensive (full scans joined against each other, or a full scan
+inside a correlated subquery). It then runs under a progress handler that
+aborts it after a VM-step budget or a wall-clock timeout. At most
+QUERY_MAX_ROWS rows are fetched, so one runaway query cannot pin a worker or
+fill its memory.
+"""
+
+import os
+import sqlite3
+import time
+
+from db import get_connection
+from observability import Counter, timed
+
+# Configuration
+QUERY_TIMEOUT_MS = int(os.getenv('QUERY_TIMEOUT_MS', '2000'))
+QUERY_MAX_VM_STEPS = int(os.getenv('QUERY_MAX_VM_STEPS', '50000000'))
+QUERY_MAX_ROWS = int(os.getenv('QUERY_MAX_ROWS', '1000'))
+# Full scans allowed side by side in one join (more means a nested-loop cross product)
+QUERY_MAX_JOINED_SCANS = int(os.getenv('QUERY_MAX_JOINED_SCANS', '1'))
+
+# SQLite VM instructions between progress handler calls
+PROGRESS_INTERVAL = 1000
+
+GUARD_EVENTS = Counter(
+    "query_guard_events_total",
+    "Raw SQL queries rejected, stopped or truncated by a resource guard.",
+    ["reason"],
+)
+
+def _is_full_scan(detail):
+    return detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW"
+
+def check_query_plan(conn, sql, params=()):
+    """
+    Inspect EXPLAIN QUERY PLAN for clearly too expensive shapes
+
+    Returns:
+        An error message, or None if the plan looks acceptable
+    """
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    details = {node_id: (parent, detail) for node_id, parent, _, detail in plan}
+
+    # Full scans under the same parent are nested-loop joined with each other
+    scans_by_parent = {}
+    for node_id, (parent, detail) in details.items():
+        if _is_full_scan(detail):
+            scans_by_parent.setdefault(parent, []).append(detail)
+    for scans in scans_by_parent.values():
+        if len(scans) > QUERY_MAX_JOINED_SCANS:
+            return (f"Query rejected: it joins {len(scans)} full table scans "
+                    f"({', '.join(scans)}); add a join condition or a WHERE filter")
+
+    # A full scan inside a correlated subquery runs once per outer row
+    for node_id, (parent, detail) in details.items():
+        if not _is_full_scan(detail):
+            continue
+        ancestor = parent
+        while ancestor in details:
+            ancestor_parent, ancestor_detail = details[ancestor]
+            if ancestor_detail.startswith("CORRELATED"):
+                return f"Query rejected: a correlated subquery performs a full scan ({detail})"
+            ancestor = ancestor_parent
+    return None
+
+def execute_guarded(sql, params=(), max_rows=None, timeout_ms=None, max_vm_steps=None):
+    """
+    Run a SELECT under the plan check, VM-step, time and row budgets
+
+    Returns:
+        dict like run_sql(): "success", "data", "columns", plus "truncated"
+        when more than max_rows rows matched; "error" on failure
+    """
+    max_rows = QUERY_MAX_ROWS if max_rows is None else max_rows
+    timeout_ms = QUERY_TIMEOUT_MS if timeout_ms is None else timeout_ms
+    max_vm_steps = QUERY_MAX_VM_STEPS if max_vm_steps is None else max_vm_steps
+
+    conn = get_connection()
+    try:
+        plan_error = check_query_plan(conn, sql, params)
+    except sqlite3.Error as e:
+        return {"success": False, "error": str(e)}
+    if plan_error:
+        GUARD_EVENTS.inc(reason="plan")
+        return {"success": False, "error": plan_error}
+
+    deadline = time.monotonic() + timeout_ms / 1000
+    budget = {"steps": 0, "reason": None}
+
+    def progress():
+        budget["steps"] += PROGRESS_INTERVAL
+        if budget["steps"] > max_vm_steps:
+            budget["reason"] = "steps"
+            return 1
+        if time.monotonic() > deadline:
+            budget["reason"] = "timeout"
+            return 1
+        return 0
+
+    conn.set_progress_handler(progress, PROGRESS_INTERVAL)
+    try:
+        with timed("execute"):
+            cursor = conn.execute(sql, params)
+            columns = [desc[0] for desc in cursor.description]
+            # Fetch one extra row to find out whether the result was truncated
+            rows = cursor.fetchmany(max_rows + 1)
+            cursor.close()
+    except sqlite3.OperationalError as e:
+        if budget["reason"] == "steps":
+            GUARD_EVENTS.inc(reason="steps")
+            return {"success": False, "error": f"Query stopped: exceeded the budget of {max_vm_steps} SQLite VM steps"}
+        if budget["reason"] == "timeout":
+            GUARD_EVENTS.inc(reason="timeout")
+            return {"success": False, "error": f"Query stopped: exceeded the {timeout_ms} ms time limit"}
+        return {"success": False, "error": str(e)}
+    except sqlite3.Error as e:
+        return {"success": False, "error": str(e)}
+    finally:
+        conn.set_progress_handler(None, 0)
+
+    truncated = len(rows) > max_rows
+    if truncated:
+        GUARD_EVENTS.inc(reason="rows_truncated")
+    # Not kept in the result cache: a raw query can return up to max_rows
+    # rows of every column, far more than the cache's typical entry
+    return {
+        "success": True,
+        "data": [dict(zip(columns, row)) for row in rows[:max_rows]],
+        "columns": columns,
+        "truncated": truncated,
+        "row_limit": max_rows,
+    }
@@ -0,0 +1,271 @@
+"""
+Single-pass, token-level normalization of model-generated SQL.
+
+Raw model SQL often has bare or mis-cased column names (STATE, Rainfall),
+double-quoted or unquoted string literals, a wrong table name, no LIMIT or
+a truncated tail. SQLRewriter tokenizes a statement once and fixes all of
+these in one linear pass, using an alias table compiled from the schema.
+Quoted identifiers and string literals are single tokens, so a rewrite can
+never reach inside them the way str.replace("STATE", ...) did.
+"""
+
+import re
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<quoted>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+  | (?P<number>\d+(?:\.\d*)?|\.\d+)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op><=|>=|<>|!=|==|\|\||.)
+""", re.VERBOSE | re.DOTALL)
+
+KEYWORDS = frozenset("""
+    ALL AND AS ASC BETWEEN BY CASE CAST COLLATE CROSS DESC DISTINCT ELSE END ESCAPE EXCEPT
+    EXISTS FROM GLOB GROUP HAVING IN INNER INTERSECT IS ISNULL JOIN LEFT LIKE LIMIT MATCH
+    NATURAL NOT NOTNULL NULL OFFSET ON OR ORDER OUTER REGEXP RIGHT SELECT THEN UNION USING
+    WHEN WHERE WITH TRUE FALSE
+""".split())
+
+# Tokens after which a double-quoted or bare word is a value, not a column
+_COMPARISONS = frozenset(["=", "==", "<>", "!=", "<", ">", "<=", ">=", "LIKE", "GLOB"])
+_TABLE_KEYWORDS = frozenset(["FROM", "JOIN"])
+_CLOSED_STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+# Text before " (unit)" or " - suffix" in a column name, e.g. "Rainfall" in "Rainfall (mm) - Total"
+_STEM_PATTERN = re.compile(r" \(| - ")
+
+def tokenize(sql):
+    """Split SQL into (kind, text) tokens; kinds are the group names of _TOKEN_PATTERN"""
+    return [(match.lastgroup, match.group()) for match in _TOKEN_PATTERN.finditer(sql)]
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def quote_literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+def _unquote(text):
+    """Content of a quoted identifier token, tolerating a missing closing quote"""
+    opening = text[0]
+    closing = {"[": "]"}.get(opening, opening)
+    body = text[1:-1] if len(text) > 1 and text.endswith(closing) else text[1:]
+    return body.replace('""', '"') if opening == '"' else body
+
+def _alias_key(text):
+    """Case-insensitive token sequence of a name, the alias table's key"""
+    return tuple(token.lower() for kind, token in tokenize(text) if kind != "space")
+
+class SQLRewriter:
+    """
+    Schema-aware SQL normalizer for a single-table database
+
+    The alias table maps, case-insensitively:
+    - every column name, so unquoted multi-word names are recognized,
+    - each column's stem ("STATE", "Rainfall"), to that column, or to its
+      "- Total" variant when several columns share the stem,
+    - any extra aliases given, e.g. "Ground Water".
+    It is stored as a token trie, so matching at a token costs at most the
+    length of the longest alias, whatever the number of columns.
+    """
+    def __init__(self, columns, table_name, extra_aliases=None, default_limit=10):
+        self.table_name = table_name
+        self.default_limit = default_limit
+        self.columns = {column.lower(): column for column in columns}
+
+        aliases = {_alias_key(column): column for column in columns}
+        stems = {}
+        for column in columns:
+            stems.setdefault(_alias_key(_STEM_PATTERN.split(column, 1)[0]), []).append(column)
+        for key, candidates in stems.items():
+            totals = [column for column in candidates if column.endswith("- Total")]
+            if len(candidates) == 1:
+                aliases.setdefault(key, candidates[0])
+            elif totals:
+                aliases.setdefault(key, totals[0])
+        for alias, column in (extra_aliases or {}).items():
+            if column.lower() in self.columns:
+                aliases.setdefault(_alias_key(alias), self.columns[column.lower()])
+
+        self.aliases = {}
+        self._trie = {}
+        for key, column in aliases.items():
+            # A bare SQL keyword is never taken for a column
+            if not key or (len(key) == 1 and key[0].upper() in KEYWORDS):
+                continue
+            self.aliases[key] = column
+            node = self._trie
+            for token in key:
+                node = node.setdefault(token, {})
+            node[None] = column
+
+    def lookup(self, name):
+        """Canonical column for an identifier or alias, or None"""
+        return self.columns.get(name.lower()) or self.aliases.get(_alias_key(name))
+
+    def _match(self, tokens, start):
+        """Longest alias starting at tokens[start]; returns (column, end index) or None"""
+        node = self._trie
+        best = None
+        index = start
+        while index < len(tokens):
+            kind, text = tokens[index]
+            if kind == "space":
+                index += 1
+                continue
+            node = node.get(text.lower())
+            if node is None:
+                break
+            index += 1
+            if None in node:
+                best = (node[None], index)
+        return best
+
+    def unquoted_columns(self, sql):
+        """
+        Column names or aliases that appear as bare words in sql
+
+        The word after AS names an output column, so like rewrite() it is
+        never taken for a column here.
+        """
+        tokens = tokenize(sql)
+        found = []
+        previous = None
+        for index, (kind, text) in enumerate(tokens):
+            if kind == "space":
+                continue
+            if kind == "word" and previous != "AS":
+                match = self._match(tokens, index)
+                if match:
+                    found.append(match[0])
+            previous = text.upper()
+        return found
+
+    def rewrite(self, sql, drop_unfiltered_where=False):
+        """
+        Normalize SQL in one pass over its tokens
+
+        - bare, mis-cased or backtick/bracket-quoted column names and aliases
+          become canonical double-quoted columns
+        - double-quoted and bare-word values after a comparison or in an IN
+          list become single-quoted literals; an unterminated literal is closed
+        - anything after FROM/JOIN that is not a subquery becomes the table
+        - == becomes =, runs of whitespace become one space, unbalanced
+          parentheses are closed
+        - a LIMIT is added when the outer query has none, and the statement
+          ends with exactly one semicolon
+
+        Args:
+            drop_unfiltered_where: Drop a WHERE clause that has no comparison
+                at all (the model sometimes emits a bare "WHERE <column>")
+        """
+        tokens = tokenize(sql)
+        out = []
+        depth = 0
+        in_lists = []
+        has_limit = False
+        has_comparison = False
+        where_at = None
+        previous = None
+        index = 0
+        while index < len(tokens):
+            kind, text = tokens[index]
+            upper = text.upper()
+            index += 1
+
+            if kind == "space":
+                if out and out[-1] != " ":
+                    out.append(" ")
+                continue
+
+            value_position = previous in _COMPARISONS or (
+                bool(in_lists) and in_lists[-1] == depth and previous in ("(", ","))
+
+            if kind == "word":
+                if previous in _TABLE_KEYWORDS and upper not in KEYWORDS:
+                    out.append(self.table_name)
+                    previous = "table"
+                    continue
+                match = None if previous == "AS" else self._match(tokens, index - 1)
+                if match:
+                    out.append(quote_identifier(match[0]))
+                    index = match[1]
+                    previous = "column"
+                    continue
+                if upper in KEYWORDS:
+                    if upper == "LIMIT" and depth == 0:
+                        has_limit = True
+                    if upper == "WHERE" and depth == 0 and where_at is None:
+                        where_at = len(out)
+                    if upper in _COMPARISONS:
+                        has_comparison = True
+                    out.append(text)
+                    previous = upper
+                    continue
+                if value_position and not self._next_is(tokens, index, "("):
+                    # Bare value such as TAMIL NADU: take the following plain words too
+                    words = [text]
+                    while (index + 1 < len(tokens) and tokens[index][0] == "space"
+                           and tokens[index + 1][0] == "word"
+                           and tokens[index + 1][1].upper() not in KEYWORDS):
+                        words.append(tokens[index + 1][1])
+                        index += 2
+                    out.append(quote_literal(" ".join(words)))
+                    previous = "value"
+                    continue
+                out.append(text)
+                previous = "word"
+            elif kind == "quoted":
+                name = _unquote(text)
+                column = self.lookup(name)
+                if previous in _TABLE_KEYWORDS:
+                    out.append(self.table_name)
+                    previous = "table"
+                    continue
+                if column:
+                    out.append(quote_identifier(column))
+                elif value_position:
+                    out.append(quote_literal(name))
+                else:
+                    out.append(quote_identifier(name))
+                previous = "value" if not column and value_position else "column"
+            elif kind == "string":
+                if not _CLOSED_STRING_PATTERN.fullmatch(text):
+                    text += "'"
+                out.append(text)
+                previous = "value"
+            elif kind == "op":
+                if text == ";":
+                    continue
+                if text == "==":
+                    text = "="
+                if text in _COMPARISONS:
+                    has_comparison = True
+                if text == "(":
+                    depth += 1
+                    if previous == "IN":
+                        in_lists.append(depth)
+                elif text == ")":
+                    if depth == 0:
+                        continue
+                    if in_lists and in_lists[-1] == depth:
+                        in_lists.pop()
+                    depth -= 1
+                out.append(text)
+                previous = text
+            else:
+                out.append(text)
+                previous = "value"
+
+        if drop_unfiltered_where and where_at is not None and not has_comparison:
+            out = out[:where_at]
+            has_limit = False
+        sql = "".join(out).strip() + ")" * depth
+        if not has_limit:
+            sql += f" LIMIT {self.default_limit}"
+        return sql + ";"
+
+    @staticmethod
+    def _next_is(tokens, index, text):
+        while index < len(tokens) and tokens[index][0] == "space":
+            index += 1
+        return index < len(tokens) and tokens[index][1] == text
@@ -1,199 +1,376 @@
-import sqlite3
 import os
 import re
-from text2sql_local import generate_sql as model_generate_sql
-from text2sql_local_rules import RuleBasedSQLGenerator, run_sql
+import time
+import logging
+from text2sql_local_rules import sql_generator, run_sql, analyze_query_intent, prune_projection
+from db import get_connection, parameterize_sql, render_sql
+from sql_rewriter import SQLRewriter
+from observability import STAGE_SECONDS, GENERATIONS, FALLBACKS, VALIDATION_FAILURES, timed
+
+logger = logging.getLogger(__name__)
 
 # Configuration
-DB_PATH = os.getenv('SQLITE_DB_PATH', 'local_data.db')
 TABLE_NAME = "facts_assessment"
+# "hybrid" tries the model first with rule-based fallback, "rules" never touches
+# the model, so torch/transformers are not even imported
+NL2SQL_MODE = os.getenv('NL2SQL_MODE', 'hybrid')
+# "local" runs the PICARD + T5-small model, "stub" a deterministic offline stand-in
+MODEL_BACKEND = os.getenv('TEXT2SQL_MODEL_BACKEND', 'local')
+# Largest number of questions sent through one padded model.generate call
+MODEL_BATCH_SIZE = int(os.getenv('MODEL_BATCH_SIZE', '32'))
+
+# Share the rule-based generator instance from the rules module
+rule_generator = sql_generator
+
+# Names the model uses that are not a column name or stem in the schema
+MODEL_COLUMN_ALIASES = {
+    "Ground Water": "Ground Water Recharge (ham) - Total",
+}
+_rewriter = None
+_rewriter_schema = None
+
+_SELECT_LIST_PATTERN = re.compile(r'SELECT\s+(.*?)\s+FROM\b', re.IGNORECASE | re.DOTALL)
+_SELECT_COLUMN_PATTERN = re.compile(r'"[^"]+"|\*')
+
+# Model backend, imported on first use (see load_model_backend)
+_model_backend = None
+
+def load_model_backend():
+    """Import the configured model backend module; heavy imports happen only here"""
+    global _model_backend
+    if _model_backend is None:
+        if MODEL_BACKEND == "stub":
+            import text2sql_stub as backend
+        else:
+            import text2sql_local as backend
+        _model_backend = backend
+    return _model_backend
+
+def model_generate_sql(question):
+    """Generate SQL with the model backend, importing it on first use"""
+    return load_model_backend().generate_sql(question)
+
+def model_generate_sql_batch(questions):
+    """Generate SQL for many questions with batched model calls"""
+    backend = load_model_backend()
+    results = []
+    for start in range(0, len(questions), MODEL_BATCH_SIZE):
+        results.extend(backend.generate_sql_batch(questions[start:start + MODEL_BATCH_SIZE]))
+    return results
+
+def normalize_question(question):
+    """Normalize a question for de-duplication (case and whitespace insensitive)"""
+    return " ".join(question.split()).casefold()
+
+def new_trace(question):
+    """Create an empty trace dict for one run of the hybrid pipeline"""
+    return {
+        "question": question,
+        "model_sql": None,
+        "model_error": None,
+        "enhanced_sql": None,
+        "enhanced_valid": None,
+        "additional_fixes_sql": None,
+        "additional_fixes_valid": None,
+        "rule_sql": None,
+        "rule_params": [],
+        "path": None,
+        "timings": {},
+    }
+
+def format_trace(trace):
+    """Render a trace as the human-readable debug text shown in raw_output"""
+    lines = [f"Path taken: {trace['path']}"]
+    if trace["model_error"]:
+        lines.append(f"Model failed: {trace['model_error']}")
+    if trace["model_sql"] is not None:
+        lines.append(f"Model only (before enhancements): {trace['model_sql']}")
+    if trace["enhanced_sql"] is not None:
+        verdict = "PASSED" if trace["enhanced_valid"] else "FAILED"
+        lines.append(f"Enhanced model SQL ({verdict}): {trace['enhanced_sql']}")
+    if trace["additional_fixes_sql"] is not None:
+        verdict = "PASSED" if trace["additional_fixes_valid"] else "FAILED"
+        lines.append(f"Additional fixes ({verdict}): {trace['additional_fixes_sql']}")
+    if trace["rule_sql"] is not None:
+        lines.append(f"Rule-based: {render_sql(trace['rule_sql'], trace['rule_params'])}")
+    timings = ", ".join(f"{stage}={ms:.1f}ms" for stage, ms in trace["timings"].items())
+    lines.append(f"Timings: {timings}")
+    return "\n\n".join(lines)
+
+def _timed(trace, stage, func, *args):
+    """Call func(*args), recording its wall time in the trace and the stage histogram"""
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        trace["timings"][stage] = elapsed * 1000
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+
+def _selected_columns(sql):
+    """Column names (or *) in the SELECT list of a query"""
+    match = _SELECT_LIST_PATTERN.search(sql)
+    if not match:
+        return []
+    return [col.strip('"') for col in _SELECT_COLUMN_PATTERN.findall(match.group(1))]
+
+def _model_query(sql, question):
+    """Turn model SQL into a query dict like generate_query() returns, with SELECT * pruned"""
+    template, params = parameterize_sql(prune_projection(sql, question))
+    return {
+        "sql": template,
+        "params": params,
+        "intent": analyze_query_intent(question),
+        "columns": _selected_columns(template),
+    }
 
-# Initialize the rule-based generator
-rule_generator = RuleBasedSQLGenerator(DB_PATH)
+def _rules_query(question, trace, path):
+    """Generate the rule-based query, recording it in the trace"""
+    query = _timed(trace, "rules", rule_generator.generate_query, question)
+    trace["rule_sql"] = query["sql"]
+    trace["rule_params"] = query["params"]
+    trace["path"] = path
+    GENERATIONS.inc(path=path)
+    logger.debug("Rule-based generated SQL: %s %s", query["sql"], query["params"])
+    return query
 
-def hybrid_generate_sql(question):
+def hybrid_generate_query(question, trace=None):
     """
     Hybrid approach that uses PICARD + T5-small model with rule-based fallback
     
     Args:
         question: Natural language question
+        trace: Optional dict from new_trace(); filled in with every intermediate
+            result and per-stage timings (in ms) as the pipeline runs
         
     Returns:
-        Generated SQL query
+        dict with "sql" (template with ? placeholders), "params" (bound
+        values), "intent" and "columns"
     """
-    print(f"\n--- Processing question: {question}")
-    
-    # First, extract any location information to help improve SQL generation
-    question_upper = question.upper()
-    locations = {
-        'TAMIL NADU': '"STATE - 1_level_1" = \'TAMIL NADU\'',
-        'TAMILNADU': '"STATE - 1_level_1" = \'TAMIL NADU\'',
-        'CHENNAI': '"DISTRICT - 2_level_1" = \'CHENNAI\'',
-        'COIMBATORE': '"DISTRICT - 2_level_1" = \'COIMBATORE\'',
-    }
+    if trace is None:
+        trace = new_trace(question)
+    logger.debug("Processing question: %s", question)
+    
+    # Rules-only serving mode: skip the model entirely
+    if NL2SQL_MODE == "rules":
+        return _rules_query(question, trace, "rules")
     
     # First attempt: Use the PICARD + T5-small model
     try:
-        print("Using model-based SQL generation...")
-        model_sql = model_generate_sql(question)
-        print(f"Model generated SQL: {model_sql}")
+        logger.debug("Using model-based SQL generation...")
+        model_sql = _timed(trace, "model", model_generate_sql, question)
+        query = _finish_model_sql(question, model_sql, trace)
+        if query is not None:
+            return query
         
-        # Apply enhancements to fix column names and other issues
-        enhanced_sql = enhance_sql(model_sql, "", question)
-        print(f"Enhanced model SQL: {enhanced_sql}")
-        
-        # Validate the enhanced SQL query
-        if is_valid_sql(enhanced_sql):
-            print("Enhanced model SQL validation: PASSED ✓")
-            return enhanced_sql
-        else:
-            print("Enhanced model SQL validation: FAILED ✗, attempting additional fixes")
-            
-            # Try with additional fixes if validation fails
-            additional_fixes = apply_additional_fixes(enhanced_sql)
-            if is_valid_sql(additional_fixes):
-                print("Additional fixes validation: PASSED ✓")
-                return additional_fixes
-            else:
-                print("Additional fixes validation: FAILED ✗")
-                
-                # FALL BACK TO RULE-BASED if model approach fails validation
-                print("Falling back to rule-based SQL generation...")
-                rule_sql = rule_generator.generate_sql(question)
-                print(f"Rule-based generated SQL: {rule_sql}")
-                return rule_sql
+        # FALL BACK TO RULE-BASED if model approach fails validation
+        logger.info("Falling back to rule-based SQL generation for: %s", question)
+        FALLBACKS.inc(reason="validation")
+        return _rules_query(question, trace, "rules_fallback")
             
     except Exception as e:
-        print(f"Error with model-based generation: {str(e)}")
+        logger.warning("Error with model-based generation: %s", e)
+        trace["model_error"] = str(e)
         
         # Fall back to rule-based if there's any exception with the model
-        print("Falling back to rule-based SQL generation due to exception...")
-        rule_sql = rule_generator.generate_sql(question)
-        print(f"Rule-based generated SQL: {rule_sql}")
-        return rule_sql
+        logger.info("Falling back to rule-based SQL generation due to exception...")
+        FALLBACKS.inc(reason="model_error")
+        return _rules_query(question, trace, "rules_after_model_error")
+
+def _finish_model_sql(question, model_sql, trace):
+    """
+    Enhance and validate raw model SQL, recording each step in the trace
+    
+    Returns:
+        The model query dict, or None if it still fails validation after
+        the additional fixes
+    """
+    trace["model_sql"] = model_sql
+    logger.debug("Model generated SQL: %s", model_sql)
+    
+    # Apply enhancements to fix column names and other issues
+    enhanced_sql = _timed(trace, "enhance", enhance_sql, model_sql, "", question)
+    trace["enhanced_sql"] = enhanced_sql
+    logger.debug("Enhanced model SQL: %s", enhanced_sql)
+    
+    # Validate the enhanced SQL query, with literals bound as parameters
+    enhanced_query = _model_query(enhanced_sql, question)
+    trace["enhanced_valid"] = _timed(trace, "validate", is_valid_sql, enhanced_query["sql"], enhanced_query["params"])
+    if trace["enhanced_valid"]:
+        logger.debug("Enhanced model SQL validation: PASSED")
+        trace["path"] = "model"
+        GENERATIONS.inc(path="model")
+        return enhanced_query
+    
+    logger.debug("Enhanced model SQL validation: FAILED, attempting additional fixes")
+    VALIDATION_FAILURES.inc(stage="enhanced")
+    
+    # Try with additional fixes if validation fails
+    additional_fixes = _timed(trace, "additional_fixes", apply_additional_fixes, enhanced_sql)
+    trace["additional_fixes_sql"] = additional_fixes
+    fixed_query = _model_query(additional_fixes, question)
+    trace["additional_fixes_valid"] = _timed(trace, "validate_additional_fixes", is_valid_sql, fixed_query["sql"], fixed_query["params"])
+    if trace["additional_fixes_valid"]:
+        logger.debug("Additional fixes validation: PASSED")
+        trace["path"] = "model_additional_fixes"
+        GENERATIONS.inc(path="model_additional_fixes")
+        return fixed_query
+    
+    logger.debug("Additional fixes validation: FAILED")
+    VALIDATION_FAILURES.inc(stage="additional_fixes")
+    return None
+
+def hybrid_generate_queries(questions):
+    """
+    Batch variant of hybrid_generate_query for bulk workloads
+    
+    Questions the rule-based generator is confident about are answered by the
+    rules; the rest go through the model together in padded batches, and fall
+    back to their rule-based query if the model SQL fails validation.
+    
+    Args:
+        questions: List of (already de-duplicated) natural language questions
         
+    Returns:
+        List of (query, trace) pairs in input order; query is None and
+        trace["error"] is set when no SQL could be generated
+    """
+    results = [None] * len(questions)
+    rule_queries = {}
+    model_indexes = []
+    
+    for i, question in enumerate(questions):
+        trace = new_trace(question)
+        try:
+            rule_query = _timed(trace, "rules", rule_generator.generate_query, question)
+        except Exception as e:
+            trace["error"] = f"Failed to generate SQL: {str(e)}"
+            results[i] = (None, trace)
+            continue
+        trace["rule_sql"] = rule_query["sql"]
+        trace["rule_params"] = rule_query["params"]
+        if NL2SQL_MODE == "rules" or rule_query["confident"]:
+            trace["path"] = "rules" if NL2SQL_MODE == "rules" else "rules_confident"
+            GENERATIONS.inc(path=trace["path"])
+            results[i] = (rule_query, trace)
+        else:
+            rule_queries[i] = rule_query
+            results[i] = (None, trace)
+            model_indexes.append(i)
+    
+    if not model_indexes:
+        return results
+    
+    try:
+        with timed("model_batch"):
+            model_sqls = model_generate_sql_batch([questions[i] for i in model_indexes])
+    except Exception as e:
+        logger.warning("Error with batched model generation: %s", e)
+        model_sqls = [None] * len(model_indexes)
+        for i in model_indexes:
+            results[i][1]["model_error"] = str(e)
+    
+    for i, model_sql in zip(model_indexes, model_sqls):
+        question, trace = questions[i], results[i][1]
+        query = None
+        if model_sql is not None:
+            try:
+                query = _finish_model_sql(question, model_sql, trace)
+            except Exception as e:
+                trace["model_error"] = str(e)
+        if query is None:
+            reason = "model_error" if trace["model_error"] else "validation"
+            trace["path"] = "rules_fallback" if reason == "validation" else "rules_after_model_error"
+            FALLBACKS.inc(reason=reason)
+            GENERATIONS.inc(path=trace["path"])
+            query = rule_queries[i]
+        results[i] = (query, trace)
+    return results
+
+def hybrid_generate_sql(question, trace=None):
+    """Hybrid NL -> SQL returning a plain SQL string (parameters inlined)"""
+    query = hybrid_generate_query(question, trace)
+    return render_sql(query["sql"], query["params"])
+        
+def get_rewriter():
+    """The SQL rewriter for the current schema, rebuilt when a snapshot changes it"""
+    global _rewriter, _rewriter_schema
+    schema = rule_generator.schema
+    if _rewriter is None or _rewriter_schema is not schema:
+        _rewriter = SQLRewriter(schema, TABLE_NAME, MODEL_COLUMN_ALIASES)
+        _rewriter_schema = schema
+    return _rewriter
+
 # Add a new function for additional fixes
 def apply_additional_fixes(sql):
     """Apply additional fixes to SQL when initial validation fails"""
-    # Fix column names again with more aggressive replacement
-    sql = sql.replace("STATE", '"STATE - 1_level_1"')
-    sql = sql.replace("DISTRICT", '"DISTRICT - 2_level_1"')
-    
-    # Fix common errors with quotes
-    sql = sql.replace('""', '"')  # Double quotes
-    sql = sql.replace("''", "'")  # Double single quotes
-    
-    # Ensure proper WHERE clause format
-    if "WHERE" in sql.upper() and "=" not in sql:
-        sql = sql.split("WHERE")[0] + " LIMIT 10;"
-    
-    # Always add LIMIT if missing
-    if "LIMIT" not in sql.upper():
-        if sql.endswith(";"):
-            sql = sql[:-1] + " LIMIT 10;"
-        else:
-            sql = sql + " LIMIT 10;"
-    
-    return sql
+    # Same single pass, also dropping a WHERE clause that compares nothing
+    return get_rewriter().rewrite(sql, drop_unfiltered_where=True)
 
-def is_valid_sql(sql):
+def is_valid_sql(sql, params=()):
     """Check if SQL is valid by trying to run it"""
     try:
         # Simple validation
         if not sql or len(sql) < 10:
-            print("SQL too short or empty")
+            logger.debug("SQL too short or empty")
             return False
             
         if not sql.strip().lower().startswith("select"):
-            print("SQL doesn't start with SELECT")
+            logger.debug("SQL doesn't start with SELECT")
             return False
         
-        # Check for common column name issues
-        required_quotes = ["STATE", "DISTRICT", "Ground Water", "Rainfall"]
-        for column in required_quotes:
-            # Check if column appears without quotes (as a standalone word)
-            if re.search(r'(?<!\w|")' + re.escape(column) + r'(?!\w|")', sql):
-                print(f"Found unquoted column name: {column}")
-                return False
-                
-        # Check if state and district columns are properly quoted
-        if "STATE - 1_level_1" in sql and '"STATE - 1_level_1"' not in sql:
-            print("STATE column not properly quoted")
-            return False
-            
-        if "DISTRICT - 2_level_1" in sql and '"DISTRICT - 2_level_1"' not in sql:
-            print("DISTRICT column not properly quoted") 
+        # Column names must be quoted; quoted identifiers and literals are
+        # single tokens, so names inside them are never mistaken for bare ones
+        unquoted = get_rewriter().unquoted_columns(sql)
+        if unquoted:
+            logger.debug("Found unquoted column name: %s", unquoted[0])
             return False
             
-        # More thorough validation by running the query
-        conn = sqlite3.connect(DB_PATH)
-        conn.execute(sql)
-        conn.close()
-        print("SQL validated successfully")
+        # More thorough validation by running the query on the shared
+        # connection, which also leaves the statement prepared for run_sql
+        get_connection().execute(sql, params)
+        logger.debug("SQL validated successfully")
         return True
     except Exception as e:
-        print(f"SQL validation error: {str(e)}")
+        logger.debug("SQL validation error: %s", e)
         return False
         
 def enhance_sql(model_sql, rule_sql, question):
-    """Combine the best parts of model SQL and rule SQL"""
-    # First fix common column name issues (this is critical)
-    column_mappings = {
-        "STATE": '"STATE - 1_level_1"',
-        "DISTRICT": '"DISTRICT - 2_level_1"',
-        "state": '"STATE - 1_level_1"',
-        "district": '"DISTRICT - 2_level_1"',
-        "State": '"STATE - 1_level_1"',
-        "District": '"DISTRICT - 2_level_1"',
-        "Ground Water": '"Ground Water Recharge (ham) - Total"',
-        "Rainfall": '"Rainfall (mm) - Total"',
-    }
-    
-    # Apply mappings
-    for incorrect, correct in column_mappings.items():
-        # Only replace if it's a standalone column name (not part of another string)
-        model_sql = re.sub(r'(?<!\w)' + re.escape(incorrect) + r'(?!\w)', correct, model_sql)
-    
-    # If model SQL is missing proper column quoting, take it from rule-based
-    if '"' not in model_sql and '"' in rule_sql:
-        # Extract column names from rule-based query
-        rule_columns = re.findall(r'"[^"]+"', rule_sql)
-        
-        # Check if the model query contains unquoted versions of these columns
-        for quoted_col in rule_columns:
-            unquoted_col = quoted_col.strip('"')
-            if unquoted_col in model_sql:
-                model_sql = model_sql.replace(unquoted_col, quoted_col)
-    
-    # If model SQL is missing proper table name, fix it
-    if "facts_assessment" not in model_sql.lower():
-        model_sql = model_sql.replace("FROM ", f"FROM {TABLE_NAME} ")
-    
-    # If model SQL doesn't have a LIMIT clause, add one
-    if "limit" not in model_sql.lower():
-        # If there's a semicolon at the end, insert before it
-        if model_sql.strip().endswith(";"):
-            model_sql = model_sql[:-1] + " LIMIT 10;"
-        else:
-            model_sql = model_sql + " LIMIT 10;"
-            
-    # Ensure SQL ends with semicolon
-    if not model_sql.strip().endswith(";"):
-        model_sql = model_sql + ";"
-    
-    # Fix improper use of double quotes for string literals (should be single quotes)
-    model_sql = re.sub(r'=\s*"([^"]*)"', r"= '\1'", model_sql)
-            
-    return model_sql
+    """
+    Normalize raw model SQL: column names and aliases, literals, table name,
+    LIMIT and the trailing semicolon, in one token pass (see sql_rewriter).
+    rule_sql and question are no longer needed and kept for callers.
+    """
+    return get_rewriter().rewrite(model_sql)
 
-def generate_sql(question):
+def generate_sql(question, trace=None):
     """Main entry point function for NL -> SQL conversion"""
-    return hybrid_generate_sql(question)
+    return hybrid_generate_sql(question, trace)
+
+def generate_query(question, trace=None):
+    """Main entry point returning a parameterized query (sql template + params)"""
+    return hybrid_generate_query(question, trace)
+
+def generate_queries(questions):
+    """Batch entry point: (query, trace) per question, see hybrid_generate_queries"""
+    return hybrid_generate_queries(questions)
 
 # Reuse the run_sql function from the rule-based module
 # It's already imported above
 
+# Model SQL shapes that must survive enhance_sql + is_valid_sql (checked below)
+MODEL_SQL_EXAMPLES = [
+    'SELECT STATE, DISTRICT, Rainfall FROM facts_assessment WHERE STATE = "TAMIL NADU"',
+    'SELECT DISTRICT AS district, Rainfall AS rainfall FROM facts_assessment WHERE STATE = "KERALA"',
+    'SELECT STATE, AVG(Rainfall) AS Rainfall FROM facts_assessment GROUP BY STATE',
+]
+
 if __name__ == "__main__":
+    # Enhanced model SQL, including output column aliases and aggregates, stays valid
+    for model_sql in MODEL_SQL_EXAMPLES:
+        enhanced = enhance_sql(model_sql, "", "")
+        assert is_valid_sql(enhanced), f"enhance_sql output failed validation: {enhanced}"
+    
     # Test the hybrid approach
     questions = [
         "Show me groundwater data for Tamil Nadu",
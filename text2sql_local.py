@@ -1,6 +1,10 @@
 from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
 import torch
 import os
+import logging
+from observability import timed
+
+logger = logging.getLogger(__name__)
 
 # Define model and cache paths
 MODEL_NAME = "tscholak/3vnuv1vf"  # PICARD + T5-small
@@ -11,51 +15,38 @@ os.makedirs(CACHE_DIR, exist_ok=True)
 
 # Function to load model and tokenizer (will download if not cached)
 def load_model_and_tokenizer():
-    print(f"Loading PICARD + T5-small model from {MODEL_NAME}...")
+    logger.info("Loading PICARD + T5-small model from %s...", MODEL_NAME)
     try:
         tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, cache_dir=CACHE_DIR)
         model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME, cache_dir=CACHE_DIR)
-        print("Model loaded successfully!")
+        logger.info("Model loaded successfully!")
         return model, tokenizer
     except Exception as e:
-        print(f"Error loading model: {str(e)}")
+        logger.error("Error loading model: %s", e)
         raise
 
 # Initialize model and tokenizer at module level (will be loaded on first import)
 try:
-    print("Initializing Text2SQL model...")
+    logger.debug("Initializing Text2SQL model...")
     model, tokenizer = None, None  # Will be loaded on first call to generate_sql
-    print("Model initialization prepared.")
+    logger.debug("Model initialization prepared.")
 except Exception as e:
-    print(f"Error during initialization: {str(e)}")
+    logger.error("Error during initialization: %s", e)
     model, tokenizer = None, None
 
-def generate_sql(question, table_info=None, max_length=256):
-    """
-    Generate SQL from natural language question
-    
-    Args:
-        question: The natural language question
-        table_info: Optional schema information about the database
-        max_length: Maximum length of generated SQL
-        
-    Returns:
-        Generated SQL query
-    """
-    global model, tokenizer
-    
-    # Load model and tokenizer if not already loaded
-    if model is None or tokenizer is None:
-        model, tokenizer = load_model_and_tokenizer()
-    
+def build_prompt(question):
+    """Build the schema-aware few-shot prompt for one question"""
     # Prepare input with explicit instruction and examples to generate a SELECT query
     examples = """
 Examples:
 Question: What is the water level in Coimbatore?
-SQL: SELECT * FROM facts_assessment WHERE "DISTRICT - 2_level_1" = 'COIMBATORE' LIMIT 10;
+SQL: SELECT "STATE - 1_level_1", "DISTRICT - 2_level_1", "Rainfall (mm) - Total", "Annual Ground water Recharge (ham) - Total", "Stage of Ground Water Extraction (%) - Total" FROM facts_assessment WHERE "DISTRICT - 2_level_1" = 'COIMBATORE' LIMIT 10;
 
 Question: Show me groundwater data from Tamil Nadu
-SQL: SELECT * FROM facts_assessment WHERE "STATE - 1_level_1" = 'TAMIL NADU' LIMIT 10;
+SQL: SELECT "STATE - 1_level_1", "DISTRICT - 2_level_1", "Rainfall (mm) - Total", "Annual Ground water Recharge (ham) - Total", "Stage of Ground Water Extraction (%) - Total" FROM facts_assessment WHERE "STATE - 1_level_1" = 'TAMIL NADU' LIMIT 10;
+
+Question: Show all columns for Chennai
+SQL: SELECT * FROM facts_assessment WHERE "DISTRICT - 2_level_1" = 'CHENNAI' LIMIT 10;
 
 Question: What is the groundwater level in Tamil Nadu?
 SQL: SELECT "STATE - 1_level_1", "DISTRICT - 2_level_1", "Ground Water Recharge (ham) - Total" FROM facts_assessment WHERE "STATE - 1_level_1" = 'TAMIL NADU' LIMIT 15;
@@ -87,25 +78,71 @@ Rules:
 SQL: 
 """
     
-    # Use a longer max_length to ensure complete queries
-    input_text = prompt
+    return prompt
+
+def _generate(prompts, max_length):
+    """Run one padded generation over a list of prompts; returns one SQL per prompt"""
+    global model, tokenizer
+    
+    # Load model and tokenizer if not already loaded
+    if model is None or tokenizer is None:
+        model, tokenizer = load_model_and_tokenizer()
     
-    # Tokenize
-    inputs = tokenizer(input_text, return_tensors="pt", padding=True)
+    # Tokenize (prompts are padded to the longest one in the batch)
+    with timed("tokenize"):
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
     
-    # Generate
     with torch.no_grad():
-        outputs = model.generate(
-            inputs.input_ids,
-            max_length=max_length,
-            num_beams=5,
-            early_stopping=True
-        )
+        # Encode once up front so encoder and decoder time are measured separately
+        with timed("encode"):
+            encoder_outputs = model.get_encoder()(
+                input_ids=inputs.input_ids,
+                attention_mask=inputs.attention_mask
+            )
+        
+        # Generate
+        with timed("generate"):
+            outputs = model.generate(
+                encoder_outputs=encoder_outputs,
+                attention_mask=inputs.attention_mask,
+                max_length=max_length,
+                num_beams=5,
+                early_stopping=True
+            )
     
     # Decode
-    sql = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    with timed("decode"):
+        decoded = tokenizer.batch_decode(outputs, skip_special_tokens=True)
     
     # Clean up the output if needed
-    sql = sql.replace("```sql", "").replace("```", "").strip()
+    return [sql.replace("```sql", "").replace("```", "").strip() for sql in decoded]
+
+def generate_sql(question, table_info=None, max_length=256):
+    """
+    Generate SQL from natural language question
+    
+    Args:
+        question: The natural language question
+        table_info: Optional schema information about the database
+        max_length: Maximum length of generated SQL
+        
+    Returns:
+        Generated SQL query
+    """
+    # Use a longer max_length to ensure complete queries
+    return _generate([build_prompt(question)], max_length)[0]
+
+def generate_sql_batch(questions, max_length=256):
+    """
+    Generate SQL for several questions in one padded model.generate call
     
-    return sql
\ No newline at end of file
+    Args:
+        questions: List of natural language questions
+        max_length: Maximum length of each generated SQL
+        
+    Returns:
+        List of generated SQL queries, in the same order as questions
+    """
+    if not questions:
+        return []
+    return _generate([build_prompt(question) for question in questions], max_length)
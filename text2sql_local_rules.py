@@ -1,9 +1,11 @@
-import sqlite3
-import os
 import re
+import logging
+from observability import timed
+from db import get_connection, open_connection, active_source, on_source_change, result_cache, render_sql
+
+logger = logging.getLogger(__name__)
 
 # Configuration
-DB_PATH = os.getenv('SQLITE_DB_PATH', 'local_data.db')
 TABLE_NAME = "facts_assessment"
 
 class RuleBasedSQLGenerator:
@@ -11,19 +13,25 @@ class RuleBasedSQLGenerator:
     Simple rule-based SQL generator for groundwater data questions.
     No model downloads needed, works right away.
     """
-    def __init__(self, db_path):
-        self.db_path = db_path
+    def __init__(self, db_path, snapshot=False):
         self.table_name = TABLE_NAME
-        self.schema = self._get_schema()
         # Map correct column names for states and districts
         self.state_column = '"STATE - 1_level_1"'
         self.district_column = '"DISTRICT - 2_level_1"'
-        self.states = self._get_distinct_values(self.state_column)
-        self.districts = self._get_distinct_values(self.district_column)
+        self.reload(db_path, snapshot)
+        
+    def reload(self, db_path, snapshot=False):
+        """(Re)build the cached schema and state/district lists from a database"""
+        self.db_path = db_path
+        self.snapshot = snapshot
+        schema = self._get_schema()
+        states = self._get_distinct_values(self.state_column)
+        districts = self._get_distinct_values(self.district_column)
+        self.schema, self.states, self.districts = schema, states, districts
         
     def _get_schema(self):
         """Get table schema information"""
-        conn = sqlite3.connect(self.db_path)
+        conn = open_connection(self.db_path, self.snapshot)
         cursor = conn.cursor()
         cursor.execute(f"PRAGMA table_info({self.table_name});")
         columns = [col[1] for col in cursor.fetchall()]
@@ -32,7 +40,7 @@ class RuleBasedSQLGenerator:
         
     def _get_distinct_values(self, column_name):
         """Get distinct values for a column"""
-        conn = sqlite3.connect(self.db_path)
+        conn = open_connection(self.db_path, self.snapshot)
         cursor = conn.cursor()
         try:
             cursor.execute(f"SELECT DISTINCT {column_name} FROM {self.table_name} LIMIT 20;")
@@ -41,17 +49,27 @@ class RuleBasedSQLGenerator:
             return values
         except Exception as e:
             conn.close()
-            print(f"Error getting distinct values for {column_name}: {str(e)}")
+            logger.warning("Error getting distinct values for %s: %s", column_name, e)
             return []
         
     def generate_sql(self, question):
-        """Generate SQL based on the question using rules"""
+        """Generate SQL based on the question using rules (parameters inlined)"""
+        query = self.generate_query(question)
+        return render_sql(query["sql"], query["params"])
+        
+    def generate_query(self, question):
+        """
+        Generate a parameterized query based on the question using rules
+        
+        Returns:
+            dict with "sql" (template with ? placeholders), "params" (bound
+            location values), "intent", "columns" (selected column names) and
+            "confident" (the question named an intent explicitly, so the rules
+            can answer it without the model)
+        """
         original_question = question
         question = question.upper()
         
-        # Default query if we can't match anything specific
-        default_query = f'SELECT * FROM {self.table_name} LIMIT 10;'
-        
         # Detect if this is an availability-related question
         availability_keywords = ["AVAILABLE", "AVAILABILITY", "REMAINING", "LEFT", "USABLE", "UNUSED", "FUTURE USE"]
         is_availability_question = any(keyword in question for keyword in availability_keywords)
@@ -87,8 +105,10 @@ class RuleBasedSQLGenerator:
         
         # Check for pattern matches
         if "RAINFALL" in question:
+            intent = "rainfall"
             selected_columns = rainfall_columns
         elif query_intent == "availability" or is_availability_question:
+            intent = "availability"
             # Specifically look for availability-related columns
             availability_columns = [
                 f'"{col}"' for col in self.schema 
@@ -97,35 +117,22 @@ class RuleBasedSQLGenerator:
             ]
             
             # Add identifying columns and limit to avoid overwhelming results
-            selected_columns = [
-                '"STATE - 1_level_1"',
-                '"DISTRICT - 2_level_1"',
-                '"Net Annual Ground Water Availability for Future Use (ham) - Total"',
-                '"Annual Extractable Ground water Resource (ham) - Total"'
-            ]
+            selected_columns = _quoted(IDENTIFYING_COLUMNS + INTENT_COLUMNS["availability"])
         elif "WATER LEVEL" in question or "GROUND WATER" in question or "GROUNDWATER" in question:
             # Select groundwater columns based on the specific intent
+            intent = query_intent
             if query_intent == "recharge":
                 recharge_columns = [
                     f'"{col}"' for col in self.schema 
                     if "RECHARGE" in col.upper() and "TOTAL" in col.upper()
                 ]
-                selected_columns = [
-                    '"STATE - 1_level_1"',
-                    '"DISTRICT - 2_level_1"',
-                    '"Annual Ground water Recharge (ham) - Total"'
-                ]
+                selected_columns = _quoted(IDENTIFYING_COLUMNS + INTENT_COLUMNS["recharge"])
             elif query_intent == "extraction":
                 extraction_columns = [
                     f'"{col}"' for col in self.schema 
                     if "EXTRACTION" in col.upper() and "TOTAL" in col.upper()
                 ]
-                selected_columns = [
-                    '"STATE - 1_level_1"',
-                    '"DISTRICT - 2_level_1"',
-                    '"Ground Water Extraction for all uses (ha.m) - Total"',
-                    '"Stage of Ground Water Extraction (%) - Total"'
-                ]
+                selected_columns = _quoted(IDENTIFYING_COLUMNS + INTENT_COLUMNS["extraction"])
             else:
                 # Default to some basic groundwater columns
                 if len(groundwater_columns) > 4:
@@ -135,32 +142,34 @@ class RuleBasedSQLGenerator:
                     selected_columns = groundwater_columns
         else:
             # For generic queries, pick some representative columns
-            selected_columns = [
-                '"STATE - 1_level_1"',
-                '"DISTRICT - 2_level_1"',
-                '"Rainfall (mm) - Total"',
-                '"Annual Ground water Recharge (ham) - Total"',
-                '"Stage of Ground Water Extraction (%) - Total"'
-            ]
+            intent = "general"
+            selected_columns = _quoted(IDENTIFYING_COLUMNS + INTENT_COLUMNS["general"])
+            
+        # Every column only when the user explicitly asked for all of them
+        if wants_all_columns(original_question):
+            selected_columns = ["*"]
             
         # Add basic identifying columns if not already included
-        state_district_included = False
+        state_district_included = selected_columns == ["*"]
         for col in selected_columns:
             if "STATE" in col.upper() or "DISTRICT" in col.upper():
                 state_district_included = True
                 break
                 
         if not state_district_included:
-            select_clause = f'SELECT {self.state_column}, {self.district_column}, {", ".join([f"{col}" for col in selected_columns])}'
-        else:
-            select_clause = f'SELECT {", ".join([f"{col}" for col in selected_columns])}'
+            selected_columns = [self.state_column, self.district_column] + selected_columns
+        select_clause = f'SELECT {", ".join([f"{col}" for col in selected_columns])}'
             
-        # Build WHERE clause based on location
+        # Build WHERE clause based on location; values are bound, never inlined,
+        # so every location shares one statement per template
         where_conditions = []
+        params = []
         if state_match:
-            where_conditions.append(f'{self.state_column} = \'{state_match}\'')
+            where_conditions.append(f'{self.state_column} = ?')
+            params.append(state_match)
         if district_match:
-            where_conditions.append(f'{self.district_column} = \'{district_match}\'')
+            where_conditions.append(f'{self.district_column} = ?')
+            params.append(district_match)
             
         # Construct final query
         if where_conditions:
@@ -168,46 +177,135 @@ class RuleBasedSQLGenerator:
         else:
             query = f"{select_clause} FROM {self.table_name} LIMIT 10;"
             
-        return query
+        return {
+            "sql": query,
+            "params": params,
+            "intent": intent,
+            "columns": [col.strip('"') for col in selected_columns],
+            "confident": "RAINFALL" in question or is_availability_question or has_explicit_intent(question),
+        }
 
 # Initialize the generator
-sql_generator = RuleBasedSQLGenerator(DB_PATH)
+sql_generator = RuleBasedSQLGenerator(active_source()["path"], active_source()["snapshot"])
+
+def _reload_generator(source, changes):
+    """Rebuild the cached state/district lists whenever a new snapshot goes live"""
+    if changes is not None and not changes["inserted"] and not changes.get("deleted"):
+        # A snapshot that only updated existing rows leaves the location lists as they are
+        sql_generator.db_path = source["path"]
+        sql_generator.snapshot = source["snapshot"]
+        return
+    sql_generator.reload(source["path"], source["snapshot"])
+
+on_source_change(_reload_generator)
 
 def generate_sql(question):
     """Generate SQL from natural language question"""
     return sql_generator.generate_sql(question)
 
+def generate_query(question):
+    """Generate a parameterized query (sql template + params) from a question"""
+    return sql_generator.generate_query(question)
+
 def ensure_complete_sql(sql):
     """Make sure SQL is valid (already valid in our case)"""
     return sql
 
-def run_sql(sql):
-    """Run SQL and return results"""
+def run_sql(sql, params=()):
+    """Run SQL (optionally a template with bound params) and return results"""
+    cached = result_cache.get(sql, params)
+    if cached is not None:
+        return cached
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.execute(sql)
-        columns = [desc[0] for desc in cursor.description]
-        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        conn.close()
-        return {"success": True, "data": rows, "columns": columns}
+        with timed("execute"):
+            # The thread's shared connection reuses the prepared statement per template
+            cursor = get_connection().execute(sql, params)
+            columns = [desc[0] for desc in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        result = {"success": True, "data": rows, "columns": columns}
+        result_cache.put(sql, params, result)
+        return result
     except Exception as e:
         return {"success": False, "error": str(e)}
         
+# Mapping of concepts to the keywords that signal them
+INTENT_KEYWORDS = {
+    "availability": ["NET ANNUAL", "AVAILABILITY", "AVAILABLE", "EXTRACTABLE", "FUTURE USE"],
+    "recharge": ["RECHARGE", "REPLENISHMENT", "INFLOW"],
+    "extraction": ["EXTRACTION", "USAGE", "CONSUMPTION", "UTILISATION", "UTILIZATION"],
+    "levels": ["LEVEL", "DEPTH", "HEIGHT"]
+}
+
+# Always part of a pruned projection, so every row can be told apart
+IDENTIFYING_COLUMNS = ["STATE - 1_level_1", "DISTRICT - 2_level_1"]
+
+# Columns shown per intent instead of all ~150 columns of SELECT *
+INTENT_COLUMNS = {
+    "rainfall": ["Rainfall (mm) - C", "Rainfall (mm) - NC", "Rainfall (mm) - PQ", "Rainfall (mm) - Total"],
+    "availability": [
+        "Net Annual Ground Water Availability for Future Use (ham) - Total",
+        "Annual Extractable Ground water Resource (ham) - Total",
+    ],
+    "recharge": ["Annual Ground water Recharge (ham) - Total"],
+    "extraction": [
+        "Ground Water Extraction for all uses (ha.m) - Total",
+        "Stage of Ground Water Extraction (%) - Total",
+    ],
+    "general": [
+        "Rainfall (mm) - Total",
+        "Annual Ground water Recharge (ham) - Total",
+        "Stage of Ground Water Extraction (%) - Total",
+    ],
+}
+
+# Phrases asking for every column, e.g. "all columns", "every field", "full details"
+_ALL_COLUMNS_PATTERN = re.compile(
+    r"\b(?:ALL|EVERY)\s+(?:THE\s+)?(?:COLUMNS?|FIELDS?|ATTRIBUTES|DETAILS)\b|\bFULL\s+(?:DETAILS|RECORDS?|ROWS?)\b",
+    re.IGNORECASE,
+)
+# A top-level SELECT * (not COUNT(*) or a subquery's)
+_SELECT_STAR_PATTERN = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)\*(\s+FROM\b)", re.IGNORECASE)
+
+def _quoted(columns):
+    return [f'"{col}"' for col in columns]
+
+def wants_all_columns(question):
+    """True if the user explicitly asked for every column"""
+    return bool(_ALL_COLUMNS_PATTERN.search(question))
+
+def projection_intent(question):
+    """The INTENT_COLUMNS key whose columns answer a question"""
+    question = question.upper()
+    if "RAINFALL" in question:
+        return "rainfall"
+    intent = analyze_query_intent(question)
+    # analyze_query_intent guesses "recharge" for anything without a keyword
+    if intent == "recharge" and not has_explicit_intent(question):
+        return "general"
+    return intent if intent in INTENT_COLUMNS else "general"
+
+def prune_projection(sql, question):
+    """
+    Replace a top-level SELECT * with the identifying columns plus the
+    columns for the question's intent, unless every column was asked for
+    """
+    if wants_all_columns(question):
+        return sql
+    select_list = ", ".join(_quoted(IDENTIFYING_COLUMNS + INTENT_COLUMNS[projection_intent(question)]))
+    return _SELECT_STAR_PATTERN.sub(lambda match: match.group(1) + select_list + match.group(2), sql, count=1)
+
+def has_explicit_intent(question):
+    """True if the question contains a direct intent keyword (no guessing needed)"""
+    question = question.upper()
+    return any(keyword in question for keywords in INTENT_KEYWORDS.values() for keyword in keywords)
+
 # Add specialized analysis for complex queries
 def analyze_query_intent(question):
     """Analyze the query intent to better handle ambiguous terms"""
     question = question.upper()
     
-    # Create mapping of concepts to columns
-    intent_mappings = {
-        "availability": ["NET ANNUAL", "AVAILABILITY", "AVAILABLE", "EXTRACTABLE", "FUTURE USE"],
-        "recharge": ["RECHARGE", "REPLENISHMENT", "INFLOW"],
-        "extraction": ["EXTRACTION", "USAGE", "CONSUMPTION", "UTILISATION", "UTILIZATION"],
-        "levels": ["LEVEL", "DEPTH", "HEIGHT"]
-    }
-    
     # Check for direct intent signals
-    for intent, keywords in intent_mappings.items():
+    for intent, keywords in INTENT_KEYWORDS.items():
         for keyword in keywords:
             if keyword in question:
                 return intent
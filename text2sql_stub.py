@@ -0,0 +1,60 @@
+"""
+Deterministic stand-in for the PICARD + T5-small model in text2sql_local.
+Select it with TEXT2SQL_MODEL_BACKEND=stub to run the hybrid pipeline, the
+benchmarks and traffic replays offline without torch or a model download.
+
+The output imitates raw model SQL (bare column names, double-quoted
+literals, missing LIMIT) so enhance_sql and is_valid_sql do real work.
+"""
+
+import os
+import re
+import time
+
+# Optional artificial latency per call, to emulate inference cost in load tests
+STUB_LATENCY_MS = float(os.getenv('STUB_MODEL_LATENCY_MS', '0'))
+
+STATES = (
+    "ANDHRA PRADESH", "ARUNACHAL PRADESH", "ASSAM", "BIHAR", "CHHATTISGARH", "GOA",
+    "GUJARAT", "HARYANA", "HIMACHAL PRADESH", "JHARKHAND", "KARNATAKA", "KERALA",
+    "MADHYA PRADESH", "MAHARASHTRA", "MANIPUR", "MEGHALAYA", "MIZORAM", "NAGALAND",
+    "ODISHA", "PUNJAB", "RAJASTHAN", "SIKKIM", "TAMIL NADU", "TELANGANA", "TRIPURA",
+    "UTTAR PRADESH", "UTTARAKHAND", "WEST BENGAL",
+)
+
+_LOCATION_PATTERN = re.compile(r"\b(?:in|for|from|of)\s+([A-Z][\w']*(?:\s+[A-Z][\w']*)*)")
+
+def _extract_location(question):
+    """Return the capitalised phrase after in/for/from/of, upper-cased"""
+    match = _LOCATION_PATTERN.search(question)
+    if not match:
+        return None
+    return match.group(1).upper()
+
+def generate_sql(question, table_info=None, max_length=256):
+    """Generate model-like SQL for a question without loading a model"""
+    if STUB_LATENCY_MS:
+        time.sleep(STUB_LATENCY_MS / 1000)
+    return _stub_sql(question)
+
+def _stub_sql(question):
+    question_upper = question.upper()
+    if "RAINFALL" in question_upper:
+        columns = "STATE, DISTRICT, Rainfall"
+    elif "RECHARGE" in question_upper or "LEVEL" in question_upper:
+        columns = "STATE, DISTRICT, Ground Water"
+    else:
+        columns = "*"
+
+    sql = f"SELECT {columns} FROM facts_assessment"
+    location = _extract_location(question)
+    if location:
+        column = "STATE" if location in STATES else "DISTRICT"
+        sql += f' WHERE {column} = "{location}"'
+    return sql
+
+def generate_sql_batch(questions, max_length=256):
+    """Batch variant; the artificial latency is paid once, like one padded generate"""
+    if STUB_LATENCY_MS and questions:
+        time.sleep(STUB_LATENCY_MS / 1000)
+    return [_stub_sql(question) for question in questions]
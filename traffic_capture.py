@@ -0,0 +1,154 @@
+"""
+Opt-in capture of /nl2sql and /query traffic for replay (see benchmarks/replay.py).
+
+Set TRAFFIC_CAPTURE_PATH to append one compact JSON record per request:
+arrival time, endpoint, question or SQL, HTTP status, latency, and whatever
+the handler added with annotate() (path taken, rows returned, errors). The
+file is rotated like a RotatingFileHandler: at TRAFFIC_CAPTURE_MAX_BYTES it
+moves to <path>.1, <path>.1 to <path>.2 and so on, keeping
+TRAFFIC_CAPTURE_BACKUPS old files. Records are written by a background
+thread, never on the event loop.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from observability import Counter
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH', '')
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv('TRAFFIC_CAPTURE_MAX_BYTES', str(50 * 1024 * 1024)))
+TRAFFIC_CAPTURE_BACKUPS = int(os.getenv('TRAFFIC_CAPTURE_BACKUPS', '5'))
+# Records waiting for the writer thread before new ones are dropped
+TRAFFIC_CAPTURE_QUEUE_SIZE = int(os.getenv('TRAFFIC_CAPTURE_QUEUE_SIZE', '10000'))
+
+# Endpoint -> query parameter holding the request's input
+CAPTURED_ENDPOINTS = {
+    "/nl2sql": "question",
+    "/query": "sql",
+}
+
+CAPTURE_DROPPED = Counter(
+    "traffic_capture_dropped_total",
+    "Traffic capture records dropped because the writer fell behind or failed.",
+)
+
+_record = contextvars.ContextVar("traffic_record", default=None)
+
+def annotate(**fields):
+    """Add fields to the current request's capture record (no-op when not capturing)"""
+    record = _record.get()
+    if record is not None:
+        record.update(fields)
+
+class TrafficLog:
+    """
+    JSONL appender with size-based rotation
+
+    write() only queues the record; a background thread does the file I/O,
+    so the request path never waits on the disk. When the queue is full
+    (the disk cannot keep up) records are dropped and counted.
+    """
+    def __init__(self, path, max_bytes=TRAFFIC_CAPTURE_MAX_BYTES, backups=TRAFFIC_CAPTURE_BACKUPS,
+                 queue_size=TRAFFIC_CAPTURE_QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="traffic-capture", daemon=True)
+        self._thread.start()
+
+    def write(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            CAPTURE_DROPPED.inc()
+
+    def close(self):
+        """Write out the queued records and stop the writer thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            try:
+                self._append(record)
+                # Flush once the backlog is written rather than after every line
+                if self._queue.empty():
+                    self._file.flush()
+            except OSError:
+                logger.exception("Failed to write traffic capture record to %s", self.path)
+                CAPTURE_DROPPED.inc()
+        if self._file is not None:
+            self._file.close()
+
+    def _append(self, record):
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        if self.max_bytes > 0 and self._file.tell() + len(line) > self.max_bytes and self._file.tell() > 0:
+            self._rotate()
+        self._file.write(line)
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+def install(app, path=None):
+    """Add the capture middleware to a FastAPI app when capture is configured"""
+    path = path or TRAFFIC_CAPTURE_PATH
+    if not path:
+        return None
+    log = TrafficLog(path)
+    atexit.register(log.close)
+
+    @app.middleware("http")
+    async def capture_traffic(request, call_next):
+        field = CAPTURED_ENDPOINTS.get(request.url.path)
+        if field is None:
+            return await call_next(request)
+        record = {
+            "ts": time.time(),
+            "endpoint": request.url.path,
+            "method": request.method,
+            field: request.query_params.get(field),
+        }
+        token = _record.set(record)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+            record["status"] = response.status_code
+            return response
+        except Exception:
+            record["status"] = 500
+            raise
+        finally:
+            _record.reset(token)
+            record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            log.write(record)
+
+    return log